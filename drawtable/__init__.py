@@ -2,9 +2,17 @@
 
 from __future__ import print_function
 import sys
-import collections
 import string
-from wcwidth import wcswidth
+import itertools
+import collections
+import operator
+import random
+import multiprocessing
+from drawtable.width import is_ascii, is_plain, char_width, text_width, wrap_str, cache_info
+from drawtable.store import ColumnStore, UTF8_ERRORS
+from drawtable.sort import RowSorter
+from drawtable.number import numeric_regex, to_number
+from drawtable.stats import TableStats
 from drawtable.styles import BaseStyle, BoxStyle, MarkdownStyle, RstGridStyle
 
 
@@ -15,6 +23,9 @@ PY2 = sys.version_info.major == 2
 
 if PY2:
     range = xrange  # NOQA
+    from collections import Iterable
+else:
+    from collections.abc import Iterable
 
 
 auto_header_letters = string.ascii_uppercase
@@ -22,7 +33,108 @@ auto_header_letters_num = len(auto_header_letters)
 
 
 def wc_ljust(text, length):
-    return text + (' ' * max(0, (length - wcswidth(text))))
+    return text + (' ' * max(0, (length - text_width(text))))
+
+
+# padding functions by align, `n` is the number of spaces to pad
+def pad_left_align(text, n):
+    return text + ' ' * n
+
+
+def pad_right_align(text, n):
+    return ' ' * n + text
+
+
+def pad_center_align(text, n):
+    half = n // 2
+    return ' ' * half + text + ' ' * (n - half)
+
+
+def resolve_col_key(key, header):
+    """
+    Returns the index of a column referred to by index or header value.
+    """
+    if isinstance(key, int):
+        return key
+    try:
+        return header.index(key)
+    except ValueError:
+        raise ValueError('unknown column: {!r}'.format(key))
+
+
+def _compare_op(op):
+    def compare(a, b):
+        # compare as numbers if both are numbers
+        na, nb = to_number(a), to_number(b)
+        if na is not None and nb is not None:
+            return op(na, nb)
+        return op(a, b)
+    return compare
+
+
+where_ops = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': _compare_op(operator.lt),
+    '<=': _compare_op(operator.le),
+    '>': _compare_op(operator.gt),
+    '>=': _compare_op(operator.ge),
+    '~': lambda a, b: b in a,
+    '!~': lambda a, b: b not in a,
+}
+
+
+def compile_where(where, header):
+    """
+    Compile a list of `(column, op, value)` conditions into a predicate of row,
+    a row is kept if all conditions are true. Missing values are taken as ''.
+    """
+    conditions = []
+    for key, op, value in where:
+        try:
+            func = where_ops[op]
+        except KeyError:
+            raise ValueError('op must be one of {}'.format(sorted(where_ops.keys())))
+        conditions.append((resolve_col_key(key, header), func, value))
+
+    def predicate(row):
+        row_len = len(row)
+        for index, func, value in conditions:
+            v = row[index] if index < row_len else ''
+            if not func(v, value):
+                return False
+        return True
+    return predicate
+
+
+def detect_numeric_cols(rows, cols_num):
+    """
+    Returns the set of column indexes whose non-empty values in `rows`
+    are all numbers.
+    """
+    candidates = set(range(cols_num))
+    has_value = set()
+    match = numeric_regex.match
+    for row in rows:
+        for index, v in enumerate(row):
+            if index in candidates and v:
+                if match(v):
+                    has_value.add(index)
+                else:
+                    candidates.discard(index)
+        if not candidates:
+            break
+    return candidates & has_value
+
+
+def update_cols_width(cols_width, row):
+    for index, i in enumerate(row):
+        # if not isinstance(i, str):
+        #    raise TypeError('item in row must be str, get: {:r}'.format(i))
+        i_len = text_width(i)
+        col_len = cols_width.setdefault(index, i_len)
+        if i_len > col_len:
+            cols_width[index] = i_len
 
 
 class Align:
@@ -31,6 +143,12 @@ class Align:
     center = 'center'
 
 
+class Retention:
+    none = 'none'
+    ring = 'ring'
+    full = 'full'
+
+
 class Style:
     base = 'base'
     box = 'box'
@@ -46,6 +164,12 @@ class Table(object):
         Align.center: '^',
     }
 
+    pad_funcs = {
+        Align.left: pad_left_align,
+        Align.right: pad_right_align,
+        Align.center: pad_center_align,
+    }
+
     table_styles = {
         Style.base: BaseStyle,
         Style.box: BoxStyle,
@@ -60,9 +184,25 @@ class Table(object):
     # `CONTENT` is the actual value of the line
     row_number_width = 7
 
+    # number of rows sent to a worker process at a time in `draw_rows_parallel`
+    parallel_chunk_size = 1000
+
+    # render plain rows in one format call, see `compile_row_template`
+    use_row_template = True
+
+    # buffer rows in a compact `ColumnStore` instead of lists, see `store_data`
+    use_column_store = True
+
     def __init__(self, margin_x=1, margin_y=0, align=Align.left,
                  max_col_width=16, table_style=Style.box,
-                 auto_header=False, row_numbers=False, wrap_row=True):
+                 auto_header=False, row_numbers=False, wrap_row=True,
+                 stream=False, sample_size=1000,
+                 retention=Retention.none, retention_size=1000,
+                 word_wrap=False, row_num_offset=0,
+                 window_start_col=0, window_width=None,
+                 cols_align=None, align_numeric=False, cols_config=None,
+                 columns=None, where=None, sort_by=None, sort_desc=False,
+                 sort_memory=256 * 1024 * 1024, stats=False):
         self.margin_x = margin_x
         self.margin_x_str = ' ' * margin_x
         self.margin_y = margin_y
@@ -71,18 +211,68 @@ class Table(object):
             self.align_mark = self.align_marks[align]
         except KeyError:
             raise ValueError('align must be one of {}'.format(self.align_marks.keys()))
+        # align of specific columns, keys are column indexes or header values
+        self.cols_align = cols_align or {}
+        for v in self.cols_align.values():
+            if v not in self.align_marks:
+                raise ValueError('align must be one of {}'.format(self.align_marks.keys()))
+        # right align the columns whose values are all numbers
+        self.align_numeric = align_numeric
+        self.cols_pad = None
         self.max_col_width = max_col_width
         self.table_style = self.table_styles[table_style]()
         self.auto_header = auto_header
         self.row_numbers = row_numbers
         self.row_number_tmpl = '{:>' + str(self.row_number_width) + '} '
         self.row_number_empty = self.row_number_tmpl.format('')
+        # added to the row numbers shown, for drawing rows from the middle of data
+        self.row_num_offset = row_num_offset
         self.wrap_row = wrap_row
+        # break wrapped lines on spaces when possible
+        self.word_wrap = word_wrap
+        # in stream mode, column widths are calculated from the first
+        # `sample_size` rows, the rest rows are rendered as they come
+        self.stream = stream
+        self.sample_size = sample_size
+        # rendered row strings kept in `row_strs` after writing, `ring` keeps
+        # the last `retention_size` of them
+        if retention not in (Retention.none, Retention.ring, Retention.full):
+            raise ValueError('retention must be one of {}'.format(
+                [Retention.none, Retention.ring, Retention.full]))
+        if retention == Retention.ring and retention_size < 1:
+            raise ValueError('retention_size must be at least 1 for ring retention')
+        self.retention = retention
+        self.retention_size = retention_size
+        self.row_strs = None
+        self.draw_result = {}
+        # column window, only columns from `window_start_col` that fit in
+        # `window_width` are rendered, see `get_visible_cols`
+        self.window_start_col = window_start_col
+        self.window_width = window_width
+        self.visible_cols = None
+        self.row_template = None
+        # width config of specific columns, keys are column indexes or header
+        # values, values are dicts of `max`, `min`, `fixed` widths and `hidden`
+        self.cols_config = cols_config or {}
+        self.cols_config_resolved = None
+        # projection and filter applied to the data before anything else,
+        # `columns` is a list of column indexes or header values,
+        # `where` is a list of `(column, op, value)`, see `compile_where`
+        self.columns = columns
+        self.where = where
+        # column index or header value to sort rows by, rows are sorted
+        # externally when they take more than `sort_memory` bytes
+        self.sort_by = sort_by
+        self.sort_desc = sort_desc
+        self.sort_memory = sort_memory
+        # draw a footer row of column stats, collected as rows are read,
+        # see `TableStats`
+        self.stats = stats
 
     @staticmethod
     def preprocess_data(data, has_header=True):
-        if not isinstance(data, collections.Iterable):
-            raise TypeError('data must be iterable, get: {:r}'.format(data))
+        if not isinstance(data, Iterable):
+            raise TypeError('data must be iterable, get: {!r}'.format(data))
         cols_width = {}
         header = []
         rows = []
@@ -100,15 +290,177 @@ class Table(object):
 
             # if not isinstance(row, list):
             #     raise TypeError('row in data must be list, get: {:r}'.format(row))
-            for index, i in enumerate(row):
-                # if not isinstance(i, str):
-                #    raise TypeError('item in row must be str, get: {:r}'.format(i))
-                i_len = wcswidth(i)
-                col_len = cols_width.setdefault(index, i_len)
-                if i_len > col_len:
-                    cols_width[index] = i_len
+            update_cols_width(cols_width, row)
         return header, rows, rowslen, cols_width
 
+    @staticmethod
+    def store_data(data, has_header=True):
+        """
+        Like `preprocess_data`, but rows are stored in a `ColumnStore`, which
+        takes about the size of the data in memory, instead of a `str` per cell.
+        """
+        if not isinstance(data, Iterable):
+            raise TypeError('data must be iterable, get: {!r}'.format(data))
+        it = iter(data)
+        header = []
+        if has_header:
+            header = next(it, [])
+        rows = ColumnStore()
+        rows.extend(it)
+        return header, rows, len(rows), rows.cols_width()
+
+    def buffer_data(self, data, has_header=True):
+        if self.use_column_store:
+            return self.store_data(data, has_header)
+        return self.preprocess_data(data, has_header)
+
+    def select_data(self, data, has_header=True):
+        """
+        Filter rows by `where` and project them to `columns`, lazily, so that
+        dropped rows and columns are never measured or rendered.
+        """
+        if not self.columns and not self.where:
+            return data
+        it = iter(data)
+        header = []
+        if has_header:
+            header = next(it, None)
+            if header is None:
+                return iter([])
+
+        if self.where:
+            predicate = compile_where(self.where, header)
+            it = (row for row in it if predicate(row))
+        if self.columns:
+            indexes = [resolve_col_key(i, header) for i in self.columns]
+            it = ([row[i] if i < len(row) else '' for i in indexes] for row in it)
+            if has_header:
+                header = [header[i] if i < len(header) else '' for i in indexes]
+        if has_header:
+            return itertools.chain([header], it)
+        return it
+
+    def sort_data(self, data, has_header=True):
+        """
+        Sort rows by `sort_by`, see `RowSorter`. Returns `(data, cols_width)`,
+        `cols_width` are the widths of all the rows, measured while sorting.
+        """
+        it = iter(data)
+        header = []
+        if has_header:
+            header = next(it, None)
+            if header is None:
+                return iter([]), {}
+        sorter = RowSorter(resolve_col_key(self.sort_by, header), self.sort_desc, self.sort_memory)
+        sorter.extend(it)
+        rows = sorter.sorted()
+        if has_header:
+            rows = itertools.chain([header], rows)
+        return rows, sorter.cols_width
+
+    @staticmethod
+    def observe_stats(data, has_header, stats):
+        """
+        Returns `data` with `stats` updated by the rows as they are read.
+        """
+        it = iter(data)
+        header = []
+        if has_header:
+            header = next(it, None)
+            if header is None:
+                return iter([])
+            header = [header]
+        return itertools.chain(header, stats.observe(it))
+
+    def collect_stats(self, data, head=None, tail=None, sample=None):
+        """
+        Returns `(header, stats)` of the rows selected from `data`, for
+        showing the stats of all columns as a table, see `TableStats.summary_rows`.
+        The rows are limited by `head`, `tail` or `sample` as in `draw`.
+        """
+        has_header = not self.auto_header
+        data = self.select_data(data, has_header)
+        if head is not None or tail is not None or sample is not None:
+            if self.sort_by is not None:
+                # the rows kept depend on the order
+                data, _ = self.sort_data(data, has_header)
+            data = self.limit_data(data, has_header, head, tail, sample)
+        it = iter(data)
+        header = None
+        if has_header:
+            header = next(it, [])
+        stats = TableStats()
+        for _ in stats.observe(it):
+            pass
+        return header, stats
+
+    @staticmethod
+    def limit_data(data, has_header=True, head=None, tail=None, sample=None):
+        """
+        Keep the first `head` rows, the last `tail` rows, or `sample` rows
+        picked at random (reservoir sampling, in their original order).
+
+        `head` stops reading `data` as soon as the rows are collected,
+        `tail` and `sample` have to read all of it, but only keep
+        the rows needed in memory.
+        """
+        if head is None and tail is None and sample is None:
+            return data
+        it = iter(data)
+        header = []
+        if has_header:
+            header = next(it, None)
+            if header is None:
+                return iter([])
+            header = [header]
+
+        if head is not None:
+            it = itertools.islice(it, head)
+        if tail is not None:
+            it = collections.deque(it, maxlen=tail)
+        if sample is not None:
+            reservoir = []
+            for index, row in enumerate(it):
+                if index < sample:
+                    reservoir.append((index, row))
+                else:
+                    j = random.randint(0, index)
+                    if j < sample:
+                        reservoir[j] = (index, row)
+            reservoir.sort(key=operator.itemgetter(0))
+            it = [row for _, row in reservoir]
+        return itertools.chain(header, it)
+
+    @staticmethod
+    def sample_data(data, has_header=True, sample_size=1000, cols_width=None):
+        """
+        Like `preprocess_data`, but only the first `sample_size` rows are read
+        to calculate `cols_width`, rows are returned as an iterator chaining
+        the sampled rows and the remaining of `data`, so that they could be
+        rendered lazily.
+
+        If `cols_width` is given, no row is measured, only one row is read
+        to know whether data has rows.
+
+        Note that `rowslen` is the number of sampled rows, not of all the rows.
+        """
+        if not isinstance(data, Iterable):
+            raise TypeError('data must be iterable, get: {!r}'.format(data))
+        it = iter(data)
+        header = []
+        if has_header:
+            header = next(it, header)
+
+        if cols_width is None:
+            cols_width = {}
+            sampled = list(itertools.islice(it, sample_size))
+            for row in sampled:
+                update_cols_width(cols_width, row)
+        else:
+            cols_width = dict(cols_width)
+            sampled = list(itertools.islice(it, 1))
+        return header, itertools.chain(sampled, it), len(sampled), cols_width
+
     def sub_row_generator(self, row, cols_num, cols_width):
         """
         row: [
@@ -134,12 +486,12 @@ class Table(object):
         # it's ok to define cols_split as `[]`, but `{}` is quicker in timeit result
         cols_split = {}
         max_items = 0
-        for index in range(cols_num):
+        for index in self.visible_cols:
             try:
                 i = row[index]
             except IndexError:
                 i = ''
-            sp = self._split_text(i)
+            sp = self._split_text(i, cols_width[index])
             sp_len = len(sp)
             if sp_len > max_items:
                 max_items = sp_len
@@ -149,20 +501,23 @@ class Table(object):
             yield self.cell_generator_from_sub_row(sub_row_index, cols_split, cols_num, cols_width)
 
     def cell_generator_from_sub_row(self, sub_row_index, cols_split, cols_num, cols_width):
-        for col_index in range(cols_num):
+        for col_index in self.visible_cols:
+            col_width = cols_width[col_index]
             sp = cols_split[col_index]
             try:
-                v = sp[sub_row_index]
+                v, w = sp[sub_row_index]
             except IndexError:
-                v = ''
+                v, w = '', 0
             else:
-                # truncate if too long
-                v = truncate_str(v, cols_width[col_index])
-            cell = self.margin_x_str + wc_ljust(v, cols_width[col_index]) + self.margin_x_str
+                # a single character could still be wider than the column
+                if w > col_width:
+                    v = truncate_str(v, col_width)
+                    w = text_width(v)
+            cell = self.margin_x_str + self.cols_pad[col_index](v, col_width - w) + self.margin_x_str
             yield cell
 
     def cell_generator(self, values, cols_num, cols_width):
-        for index in range(cols_num):
+        for index in self.visible_cols:
             col_width = cols_width[index]
             try:
                 i = values[index]
@@ -171,20 +526,23 @@ class Table(object):
             else:
                 # truncate if too long
                 i = truncate_str(i, col_width)
-            cell = self.margin_x_str + wc_ljust(i, col_width) + self.margin_x_str
+            cell = self.margin_x_str + self.cols_pad[index](i, col_width - text_width(i)) + self.margin_x_str
             yield cell
 
-    def _split_text(self, text):
-        if self.max_col_width == -1:
-            return [text]
+    def _split_text(self, text, col_width):
+        """
+        Returns a list of `(piece, width)` that each fits in `col_width`.
 
+        Split by `col_width` rather than `max_col_width`, they are the same
+        for values wider than the column when all rows are measured,
+        but in stream mode a row could be wider than the sampled width.
+        """
+        if not text:
+            return [('', 0)]
         sp = []
         for i in text.split('\n'):
-            if text:
-                for j in range(0, len(i), self.max_col_width):
-                    sp.append(i[j:j + self.max_col_width])
-            else:
-                sp.append(i)
+            if i:
+                sp.extend(wrap_str(i, col_width, self.word_wrap))
         return sp
 
     def draw_row_str_from_sub_rows(self, sub_row_gen, row_num):
@@ -206,12 +564,23 @@ class Table(object):
 
         return '\n'.join(sub_lines)
 
+    def draw_stats_row_str(self, row, cols_num, cols_width):
+        """
+        The stats footer row is always wrapped, with no row number.
+        """
+        lines = []
+        for cell_gen in self.sub_row_generator(row, cols_num, cols_width):
+            lines.append(self.format_line(self.table_style.draw_line(cell_gen)))
+        return '\n'.join(lines)
+
     def draw_row_str(self, cell_gen, row_num):
+        return self.draw_row_str_from_line(self.table_style.draw_line(cell_gen), row_num)
+
+    def draw_row_str_from_line(self, line, row_num):
         sub_lines = []
         for _i in range(self.margin_y):
             sub_lines.append(self.format_line(self.table_style.margin_y_str))
 
-        line = self.table_style.draw_line(cell_gen)
         if self.row_numbers:
             sub_lines.append(self.format_line_with_number(line, row_num))
         else:
@@ -222,6 +591,72 @@ class Table(object):
 
         return '\n'.join(sub_lines)
 
+    def draw_rows(self, rows, row_num, cols_num, cols_width):
+        """
+        Render `rows` numbered from `row_num + 1`, returns a list of row strings
+        with seps between them, as what `draw` writes.
+        """
+        ts = self.table_style
+        sep = None
+        if ts.has_sep:
+            sep = self.format_line(ts.sep_str)
+
+        row_strs = []
+        for row in rows:
+            if sep is not None and row_num:
+                row_strs.append(sep)
+            row_num += 1
+            line = self.format_row(row)
+            if line is not None:
+                row_strs.append(self.draw_row_str_from_line(line, row_num))
+            elif self.wrap_row:
+                row_strs.append(self.draw_row_str_from_sub_rows(
+                    self.sub_row_generator(row, cols_num, cols_width), row_num))
+            else:
+                row_strs.append(self.draw_row_str(
+                    self.cell_generator(row, cols_num, cols_width), row_num))
+        return row_strs
+
+    def draw_rows_parallel(self, rows, workers, cols_num, cols_width, write):
+        """
+        Render `rows` in a process pool and `write` the row strings in order,
+        chunks are written as soon as they and all chunks before them are done.
+
+        At most `workers * 2` chunks are pending at a time, so that `rows`
+        is not consumed faster than it could be written in stream mode.
+
+        Returns the number of rows.
+        """
+        pool = multiprocessing.Pool(
+            workers, initializer=_init_draw_rows_worker,
+            initargs=(self, cols_num, cols_width))
+        row_num = 0
+        pending = collections.deque()
+        try:
+            it = iter(rows)
+            while True:
+                chunk = list(itertools.islice(it, self.parallel_chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.apply_async(_draw_rows_chunk, (chunk, row_num)))
+                row_num += len(chunk)
+                if len(pending) >= workers * 2:
+                    for row_str in pending.popleft().get():
+                        write(row_str)
+            while pending:
+                for row_str in pending.popleft().get():
+                    write(row_str)
+        finally:
+            pool.terminate()
+            pool.join()
+        return row_num
+
+    def __getstate__(self):
+        # retained output is not needed by the worker processes
+        state = self.__dict__.copy()
+        state['row_strs'] = None
+        return state
+
     @staticmethod
     def get_auto_header_values(cols_num):
         vs = []
@@ -243,18 +678,200 @@ class Table(object):
         return line
 
     def format_line_with_number(self, line, num):
-        return self.row_number_tmpl.format(num) + line
+        return self.row_number_tmpl.format(num + self.row_num_offset) + line
 
     def cell_width(self, col_width):
         return self.margin_x * 2 + col_width
 
-    def draw(self, data, writer=None):
+    def prepare_layout(self, header, cols_width, numeric_cols=None):
+        """
+        Change `cols_width` in place according to header and config, prepare
+        the table style for the widths, returns `(cols_num, cells_width)`.
+
+        `numeric_cols` is used to align numeric columns, see `detect_numeric_cols`.
+        """
+        cols_num = max(len(cols_width), len(header))
+        self.cols_config_resolved = self.resolve_cols_config(header, cols_num)
+
+        # change cols_width according to:
+        # 1. header
+        # 2. config
+        # 3. max_col_width
+        for k in range(cols_num):
+            conf = self.cols_config_resolved[k]
+            if 'fixed' in conf:
+                cols_width[k] = conf['fixed']
+                continue
+            w = cols_width.get(k, 0)
+            if k < len(header):
+                w = max([w, text_width(header[k])])
+            max_width = conf.get('max', self.max_col_width)
+            if max_width != -1:
+                w = min([w, max_width])
+            cols_width[k] = max([w, conf.get('min', 0)])
+
+        self.visible_cols = self.get_visible_cols(cols_num, cols_width)
+        self.resolve_cols_align(header, cols_num, numeric_cols)
+        cells_width = [self.cell_width(cols_width[i]) for i in self.visible_cols]
+        ts = self.table_style
+
+        ts.prepare_margin_y(cells_width)
+        ts.prepare_sep(cells_width)
+        self.compile_row_template(cols_width)
+        return cols_num, cells_width
+
+    def resolve_cols_config(self, header, cols_num):
+        """
+        Returns the config dict of each column, looked up in `cols_config`
+        by index, then by header value.
+        """
+        resolved = []
+        for index in range(cols_num):
+            conf = self.cols_config.get(index)
+            if conf is None and index < len(header):
+                conf = self.cols_config.get(header[index])
+            resolved.append(conf or {})
+        return resolved
+
+    def get_fixed_cols_width(self, header):
+        """
+        Returns `cols_width` if every column in header has a fixed width
+        or is hidden in `cols_config`, otherwise None.
+        """
+        if not self.cols_config or not header:
+            return None
+        cols_width = {}
+        for index, conf in enumerate(self.resolve_cols_config(header, len(header))):
+            if 'fixed' in conf:
+                cols_width[index] = conf['fixed']
+            elif conf.get('hidden'):
+                cols_width[index] = 0
+            else:
+                return None
+        return cols_width
+
+    def resolve_cols_align(self, header, cols_num, numeric_cols=None):
+        """
+        Resolve the align of each column once, by priority:
+        1. `cols_align` by index or header value
+        2. right if `align_numeric` and the column is numeric
+        3. `align`
+        """
+        cols_align = []
+        for index in range(cols_num):
+            align = self.cols_align.get(index)
+            if align is None and index < len(header):
+                align = self.cols_align.get(header[index])
+            if align is None and self.align_numeric and numeric_cols and index in numeric_cols:
+                align = Align.right
+            if align is None:
+                align = self.align
+            cols_align.append(align)
+        self.cols_align_resolved = cols_align
+        self.cols_pad = [self.pad_funcs[i] for i in cols_align]
+
+    def compile_row_template(self, cols_width):
+        """
+        Compile the layout of a line into one format string, e.g.
+        `'│ {:<3} │ {:<5} │'`, for the rows whose visible values are all plain
+        ASCII and fit in their columns, which covers most rows in practice.
+        """
+        if not self.use_row_template:
+            self.row_template = None
+            return
+        ts = self.table_style
+
+        def escape(s):
+            return s.replace('{', '{{').replace('}', '}}')
+
+        margin = escape(self.margin_x_str)
+        cells = []
+        widths = []
+        for i in self.visible_cols:
+            widths.append(cols_width[i])
+            mark = self.align_marks[self.cols_align_resolved[i]]
+            cells.append(margin + '{:' + mark + str(cols_width[i]) + '}' + margin)
+        self.row_template = escape(ts.char_line_left) + escape(ts.char_line_middle).join(cells) \
+            + escape(ts.char_line_right)
+        self.row_template_widths = widths
+        cols = list(self.visible_cols)
+        if not cols:
+            self.row_template_getter = operator.itemgetter(slice(0, 0))
+            self.row_template_min_len = 0
+        else:
+            if cols == list(range(cols[0], cols[-1] + 1)):
+                self.row_template_getter = operator.itemgetter(slice(cols[0], cols[-1] + 1))
+            else:
+                # some columns are hidden
+                self.row_template_getter = operator.itemgetter(*cols)
+            self.row_template_min_len = cols[-1] + 1
+
+    def format_row(self, row):
+        """
+        Render `row` into a line by the compiled row template,
+        returns None if it's not applicable to the row.
+        """
+        if self.row_template is None:
+            return None
+        missing = self.row_template_min_len - len(row)
+        if missing > 0:
+            row = list(row) + [''] * missing
+        values = self.row_template_getter(row)
+        if not is_plain(''.join(values)):
+            return None
+        if not all(map(operator.le, map(len, values), self.row_template_widths)):
+            return None
+        return self.row_template.format(*values)
+
+    def get_visible_cols(self, cols_num, cols_width):
+        """
+        Returns the list of column indexes to render, hidden columns are
+        excluded. For the column window, columns are added from
+        `window_start_col` until the line reaches `window_width`, the last one
+        could be partially visible.
+        """
+        start = min(self.window_start_col, cols_num)
+        cols = [i for i in range(start, cols_num) if not self.cols_config_resolved[i].get('hidden')]
+        if self.window_width is None:
+            return cols
+
+        used = len(self.table_style.char_line_left)
+        if self.row_numbers:
+            used += len(self.row_number_empty)
+        visible_cols = []
+        for i in cols:
+            if used >= self.window_width:
+                break
+            used += self.cell_width(cols_width[i]) + len(self.table_style.char_line_middle)
+            visible_cols.append(i)
+        return visible_cols
+
+    def draw_header_str(self, header, cols_num, cols_width, cells_width, no_rows=False):
+        # always wrap header even if `wrap_row` is false
+        return self.format_lines(
+            self.table_style.draw_header_lines(
+                self.sub_row_generator(header, cols_num, cols_width),
+                cells_width,
+                no_rows=no_rows)
+        )
+
+    def draw(self, data, writer=None, cols_width=None, workers=None, head=None, tail=None, sample=None):
         """
         line:
         |<cell>|<cell>|...|
 
         cell:
         <margin-x><text><margin-x>
+
+        If `cols_width` (a map of column index to width) is given, or `stream`
+        is enabled, rows are rendered lazily from `data` without being
+        buffered, see `sample_data`.
+
+        If `workers` is greater than 1, rows are rendered in chunks of
+        `parallel_chunk_size` by a pool of `workers` processes, see
+        `draw_rows_parallel`.
+
+        `head`, `tail` and `sample` limit the rows to draw, see `limit_data`.
         """
         if writer is None:
             def writer(s):
@@ -263,47 +880,91 @@ class Table(object):
         has_header = True
         if self.auto_header:
             has_header = False
-        header, rows, rowslen, cols_width = self.preprocess_data(data, has_header)
+        data = self.select_data(data, has_header)
+        sorted_cols_width = None
+        if self.sort_by is not None:
+            data, sorted_cols_width = self.sort_data(data, has_header)
+            if head is None and tail is None and sample is None and cols_width is None:
+                # no need to measure the sorted rows again
+                cols_width = sorted_cols_width
+            else:
+                sorted_cols_width = None
+        data = self.limit_data(data, has_header, head, tail, sample)
+        stats = None
+        if self.stats:
+            stats = TableStats()
+            data = self.observe_stats(data, has_header, stats)
+        # whether all the rows are read before rendering
+        buffered = not (self.stream or cols_width is not None)
+        if self.stream or cols_width is not None:
+            header, rows, rowslen, cols_width = self.sample_data(
+                data, has_header, self.sample_size, cols_width)
+            data_cols_width = None
+            if sorted_cols_width is not None:
+                data_cols_width = dict(sorted_cols_width)
+        elif has_header and self.cols_config:
+            it = iter(data)
+            header = next(it, [])
+            cols_width = self.get_fixed_cols_width(header)
+            if cols_width is not None:
+                # no need to measure rows when all widths are fixed
+                _, rows, rowslen, cols_width = self.sample_data(it, False, 0, cols_width)
+                data_cols_width = None
+                buffered = False
+            else:
+                _, rows, rowslen, cols_width = self.buffer_data(it, False)
+                data_cols_width = dict(cols_width)
+        else:
+            header, rows, rowslen, cols_width = self.buffer_data(data, has_header)
+            # widths of all the rows, before being changed by header and config
+            data_cols_width = dict(cols_width)
         if not has_header:
             header = self.get_auto_header_values(len(cols_width))
+        if stats is not None and buffered:
+            # stats are complete before the layout, make room for them
+            update_cols_width(cols_width, stats.footer_row())
+
+        numeric_cols = None
+        if self.align_numeric:
+            if isinstance(rows, (list, ColumnStore)):
+                numeric_sample = rows[:self.sample_size]
+            else:
+                numeric_sample = list(itertools.islice(rows, self.sample_size))
+                rows = itertools.chain(numeric_sample, rows)
+            numeric_cols = detect_numeric_cols(numeric_sample, len(cols_width))
 
-        # change cols_width according to:
-        # 1. header
-        # 2. config
-        # 3. max_col_width
-        for k, h in enumerate(header):
-            h_len = len(h)
-            w = max([cols_width.get(k, 0), h_len])
-            if self.max_col_width != -1:
-                w = min([w, self.max_col_width])
-            cols_width[k] = w
-        cols_num = len(cols_width)
-
-        cells_width = [self.cell_width(cols_width[i]) for i in range(cols_num)]
+        cols_num, cells_width = self.prepare_layout(header, cols_width, numeric_cols)
         ts = self.table_style
 
-        ts.prepare_margin_y(cells_width)
-        ts.prepare_sep(cells_width)
-
-        row_strs = []
-
-        def append_and_write(row_str):
-            row_strs.append(row_str)
-            writer(row_str + '\n')
+        retained_bytes = [0, 0]  # current, peak
+        if self.retention == Retention.none:
+            row_strs = None
 
-        # always wrap header even if `wrap_row` is false
-        append_and_write(
-            self.format_lines(
-                ts.draw_header_lines(
-                    self.sub_row_generator(header, cols_num, cols_width),
-                    cells_width,
-                    no_rows=rowslen == 0)
-            )
-        )
+            def append_and_write(row_str):
+                writer(row_str + '\n')
+        else:
+            maxlen = None
+            if self.retention == Retention.ring:
+                maxlen = self.retention_size
+            row_strs = collections.deque(maxlen=maxlen)
+
+            def append_and_write(row_str):
+                writer(row_str + '\n')
+                if len(row_strs) == maxlen:
+                    retained_bytes[0] -= len(row_strs[0].encode('utf-8', UTF8_ERRORS))
+                row_strs.append(row_str)
+                retained_bytes[0] += len(row_str.encode('utf-8', UTF8_ERRORS))
+                if retained_bytes[0] > retained_bytes[1]:
+                    retained_bytes[1] = retained_bytes[0]
+        self.row_strs = row_strs
+
+        append_and_write(self.draw_header_str(header, cols_num, cols_width, cells_width, rowslen == 0))
 
         row_num = 0
 
-        if self.wrap_row:
+        if workers is not None and workers > 1:
+            row_num = self.draw_rows_parallel(rows, workers, cols_num, cols_width, append_and_write)
+        elif self.wrap_row:
             # wrap row hierarchy:
             #
             # row -> sub row generator
@@ -312,12 +973,18 @@ class Table(object):
             #              |
             #              for-> cell
             for row in rows:
+                # write sep before the row, so that the total number of rows
+                # is not needed to know when the last row comes
+                if ts.has_sep and row_num:
+                    append_and_write(self.format_line(ts.sep_str))
                 row_num += 1
+                line = self.format_row(row)
+                if line is not None:
+                    append_and_write(self.draw_row_str_from_line(line, row_num))
+                    continue
                 sub_row_gen = self.sub_row_generator(row, cols_num, cols_width)
 
                 append_and_write(self.draw_row_str_from_sub_rows(sub_row_gen, row_num))
-                if ts.has_sep and row_num != rowslen:
-                    append_and_write(self.format_line(ts.sep_str))
         else:
             # no wrap row hierarchy:
             #
@@ -325,42 +992,74 @@ class Table(object):
             #        |
             #        for-> cell
             for row in rows:
+                if ts.has_sep and row_num:
+                    append_and_write(self.format_line(ts.sep_str))
                 row_num += 1
+                line = self.format_row(row)
+                if line is not None:
+                    append_and_write(self.draw_row_str_from_line(line, row_num))
+                    continue
 
                 append_and_write(
                     self.draw_row_str(
                         self.cell_generator(row, cols_num, cols_width), row_num))
-                if ts.has_sep and row_num != rowslen:
-                    append_and_write(self.format_line(ts.sep_str))
+
+        if stats is not None:
+            if ts.has_sep:
+                append_and_write(self.format_line(ts.sep_str))
+            append_and_write(self.draw_stats_row_str(stats.footer_row(), cols_num, cols_width))
 
         if ts.has_footer:
             append_and_write(self.format_line(ts.draw_footer(cells_width)))
 
         self.draw_result = {
             'row_num': row_num,
+            'retained_bytes_peak': retained_bytes[1],
+            'width_cache': cache_info(),
+            'data_cols_width': data_cols_width,
+            'stats': stats,
         }
 
 
+_draw_rows_worker_args = None
+
+
+def _init_draw_rows_worker(table, cols_num, cols_width):
+    global _draw_rows_worker_args
+    _draw_rows_worker_args = (table, cols_num, cols_width)
+
+
+def _draw_rows_chunk(rows, row_num):
+    table, cols_num, cols_width = _draw_rows_worker_args
+    return table.draw_rows(rows, row_num, cols_num, cols_width)
+
+
 ellipsis_str = '…'
+ellipsis_width = 1
 
 
 def truncate_str(s, max_length):
-    len_s = len(s)
-    wc_s = wcswidth(s)
-    print('truncate_str', s, max_length, len_s, wc_s)
-    if len_s == wc_s:
-        if len_s > max_length:
-            return s[:max_length - 1] + ellipsis_str
-    else:
-        # wc truncate
-        if wc_s > max_length:
-            for i in range(len_s):
-                tr = s[:len_s - i - 1]
-                print('tr', tr)
-                if wcswidth(tr) <= max_length:
-                    return tr
+    """
+    Truncate `s` to at most `max_length` display width, the truncated part
+    is replaced with an ellipsis.
+
+    Characters are walked only once, adding up their widths, instead of
+    measuring every shorter prefix.
+    """
+    # non-printable characters are counted as one column each
+    wc_s = text_width(s)
+    if wc_s <= max_length:
+        return s
+    if max_length <= 0:
+        return ''
+    limit = max_length - ellipsis_width
+    if is_ascii(s):
+        # every character is one column wide
+        return s[:limit] + ellipsis_str
+
+    width = 0
+    for index, c in enumerate(s):
+        width += char_width(c)
+        if width > limit:
+            return s[:index] + ellipsis_str
     return s
-
-
-def wc_truncate(s, max_length):
-    len_s = len(s)
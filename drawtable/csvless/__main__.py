@@ -2,18 +2,31 @@
 # -*- coding: utf-8 -*-
 
 import io
+import os
+import re
 import csv
 import sys
 import argparse
+import itertools
 import subprocess
-from drawtable import Table, PY2
+from drawtable import Table, PY2, resolve_col_key
 from drawtable.csvless.getenv import Env
+from drawtable.csvless.writer import BufferedWriter
+from drawtable.csvless.prescan import prescan_cols_width
+from drawtable.csvless.cache import WidthCache
+from drawtable.csvless.index import RowIndex, tail_offset
+from drawtable.csvless.readers import BlockReader, ThreadedReader, open_input, make_reader, backends
+from drawtable.csvless.compress import is_compressed
+from drawtable.csvless.encoding import is_ascii_compatible
+from drawtable.csvless.dialect import sniff_dialect
+from drawtable.csvless.pager import Pager, IndexRowSource, StreamRowSource
+from drawtable.csvless.config import default_config_path, load_config, match_profile, get_table_options
 
 # TODO
 # - [x] auto header
 # - [x] generated row number
 # - [x] wrap row
-# - [ ] column width config for pattern matched file
+# - [x] column width config for pattern matched file
 
 
 def main():
@@ -33,8 +46,41 @@ def _main(args=None, writer=None):
 
     args, reader_kwgs = parse_args(parser, raw_args)
 
-    f = open_file(args.file, encoding=args.encoding)
-    reader = csv.reader(f, **reader_kwgs)
+    try:
+        f, args.encoding, sample = open_input(args.file, args.encoding)
+    except ValueError as e:
+        parser.error('{}: {}, specify it by --encoding'.format(args.file, e))
+    if args.sniff:
+        # the sample is peeked from the input, the reader reads it again from the buffer
+        reader_kwgs, has_header = sniff_dialect(sample, reader_kwgs)
+        if has_header is False:
+            args.auto_header = True
+    f, reader = make_reader(f, args.reader, args.encoding, reader_kwgs)
+    # byte offsets are only meaningful in an uncompressed regular file,
+    # whose records end with a newline byte
+    random_access = os.path.isfile(args.file) and not is_compressed(args.file) \
+        and is_ascii_compatible(args.encoding)
+    row_num_offset = 0
+    if args.from_row > 1:
+        if random_access:
+            reader = index_reader(args.file, args.from_row, not args.auto_header, args.encoding, reader_kwgs)
+        else:
+            reader = skip_rows(reader, args.from_row - 1, not args.auto_header)
+        row_num_offset = args.from_row - 1
+    elif args.tail is not None and not args.where and args.sort is None and random_access:
+        # the tail of the sorted rows needs all the rows
+        reader = tail_reader(reader, args.file, args.tail, not args.auto_header, args.encoding, reader_kwgs)
+
+    if args.columns or args.where or args.sort_by is not None:
+        reader = check_columns(parser, args, reader)
+
+    if args.read_ahead > 0:
+        reader = ThreadedReader(reader, args.read_ahead)
+
+    cols_config, cols_align = {}, {}
+    profile_columns = match_profile(load_config(args.config or default_config_path()), args.file)
+    if profile_columns:
+        cols_config, cols_align = get_table_options(profile_columns)
 
     tb = Table(
         max_col_width=args.max_column_width,
@@ -42,11 +88,75 @@ def _main(args=None, writer=None):
         auto_header=args.auto_header,
         row_numbers=args.row_numbers,
         wrap_row=args.wrap_row,
+        word_wrap=args.word_wrap,
+        stream=args.stream,
+        sample_size=args.sample_size,
+        row_num_offset=row_num_offset,
+        window_start_col=args.start_column - 1,
+        window_width=get_window_width(args.fit_width),
+        align=args.align,
+        align_numeric=args.align_numeric,
+        cols_config=cols_config,
+        cols_align=cols_align,
+        columns=args.column_keys,
+        where=args.where_conditions,
+        sort_by=args.sort_by,
+        sort_desc=args.sort_desc,
+        sort_memory=args.sort_memory * 1024 * 1024,
+        stats=args.stats_footer,
     )
 
+    draw_kwargs = {'workers': args.jobs, 'head': args.head, 'tail': args.tail, 'sample': args.sample}
+    # widths of limited rows are not those of the file
+    limited = args.head is not None or args.tail is not None or args.sample is not None
+    cache, cache_key, cached = None, None, None
+    if args.stats:
+        # show a table of the stats of the columns instead of the rows
+        header, stats = tb.collect_stats(reader, args.head, args.tail, args.sample)
+        reader = stats.summary_rows(header)
+        tb = Table(
+            max_col_width=args.max_column_width,
+            table_style=args.table_style,
+            wrap_row=args.wrap_row,
+            align_numeric=True,
+        )
+        draw_kwargs = {}
+        random_access = False
+    elif not args.no_cache and not limited:
+        cache = WidthCache(args.cache_dir)
+        cache_key = cache.key(
+            args.file, encoding=args.encoding, auto_header=args.auto_header,
+            columns=args.columns, where=args.where, **reader_kwgs)
+        if cache_key is not None:
+            cached = cache.get(cache_key)
+
+    if cached is not None and not row_num_offset:
+        draw_kwargs['cols_width'], _ = cached
+    elif args.jobs > 1 and random_access and not args.builtin_pager \
+            and not tb.columns and not tb.where and not limited:
+        # scan column widths in parallel, then rows are rendered as they are read
+        draw_kwargs['cols_width'], rowslen = prescan_cols_width(
+            args.file, args.jobs, encoding=args.encoding,
+            has_header=not args.auto_header, reader_kwargs=reader_kwgs)
+        if cache_key is not None:
+            cache.set(cache_key, draw_kwargs['cols_width'], rowslen)
+
+    if args.builtin_pager and not args.cat:
+        run_pager(args, tb, reader, reader_kwgs, draw_kwargs.get('cols_width'), limited, random_access)
+        close_input(f, reader)
+        return tb
+
     if args.cat:
-        tb.draw(reader, writer=writer)
-        f.close()
+        if writer is None:
+            if PY2:
+                bw = BufferedWriter(sys.stdout, flush_size=args.flush_size, encoding=None)
+            else:
+                bw = BufferedWriter(sys.stdout.buffer, flush_size=args.flush_size)
+            tb.draw(reader, writer=bw.write, **draw_kwargs)
+            bw.close()
+        else:
+            tb.draw(reader, writer=writer, **draw_kwargs)
+        close_input(f, reader)
     else:
         less_cmd = ['less', '-S']
         if args.line_numbers:
@@ -54,26 +164,28 @@ def _main(args=None, writer=None):
 
         p = subprocess.Popen(less_cmd, stdin=subprocess.PIPE)
 
-        counts = {'w': 0}
         if PY2:
-            def writer(line):
-                p.stdin.write(line)
-                counts['w'] += 1
+            bw = BufferedWriter(p.stdin, flush_size=args.flush_size, encoding=None)
         else:
-            def writer(line):
-                p.stdin.write(line.encode())
-                counts['w'] += 1
+            bw = BufferedWriter(p.stdin, flush_size=args.flush_size)
 
         try:
-            tb.draw(reader, writer=writer)
+            tb.draw(reader, writer=bw.write, **draw_kwargs)
+            bw.close()
         except BrokenPipeError as e:
-            if counts['w'] == 0:
+            if bw.flush_count == 0:
                 print('Zero line write before BrokenPipeError')
                 raise e
 
-        f.close()
+        close_input(f, reader)
         p.communicate()
 
+    # widths are only known for all the rows when the table is not drawn in stream mode
+    data_cols_width = tb.draw_result.get('data_cols_width')
+    if cache_key is not None and cached is None and data_cols_width is not None \
+            and not row_num_offset:
+        cache.set(cache_key, data_cols_width, tb.draw_result['row_num'])
+
     return tb
 
 
@@ -86,6 +198,11 @@ def init_parser():
     env_row_numbers = Env('{prefix}_ROW_NUMBERS', type=bool, default=False)
     env_table_style = Env('{prefix}_TABLE_STYLE', type=str, default='base')
     env_wrap_row = Env('{prefix}_WRAP_ROW', type=bool, default=True)
+    env_stream = Env('{prefix}_STREAM', type=bool, default=False)
+    env_builtin_pager = Env('{prefix}_BUILTIN_PAGER', type=bool, default=False)
+    env_config = Env('{prefix}_CONFIG', type=str, default=None)
+    env_cache_dir = Env('{prefix}_CACHE_DIR', type=str, default=None)
+    env_read_ahead = Env('{prefix}_READ_AHEAD', type=int, default=0)
 
     env_help = 'Environment Variables:\n'
     env_key_max_len = max([len(i.key) for i in Env.instances.values()])
@@ -102,7 +219,9 @@ def init_parser():
         formatter_class=argparse.RawDescriptionHelpFormatter)
 
     # arguments
-    parser.add_argument('file', metavar="FILE", type=str, help="csv file, use /dev/stdin for receiving data from pipe")
+    parser.add_argument(
+        'file', metavar="FILE", type=str,
+        help="csv file, use /dev/stdin for receiving data from pipe. gzip, bz2 and xz files are decompressed.")
 
     # display options
     display_group = parser.add_argument_group('Display options')
@@ -122,9 +241,20 @@ def init_parser():
         '-s', '--table-style', dest='table_style', type=str, choices=list(Table.table_styles.keys()),
         default=env_table_style.get(),
         help='Display style for the table, default is `base`')
+    display_group.add_argument(
+        '-a', '--align', dest='align', choices=list(Table.align_marks.keys()), default='left',
+        help='Align of the columns, default is `left`')
+    display_group.add_argument(
+        '--align-numeric', dest='align_numeric', action='store_true',
+        help='Right align the columns whose values are all numbers.')
     display_group.add_argument(
         '--cat', dest='cat', action='store_true',
         help='Behave like cat, print to stdout directly')
+    display_group.add_argument(
+        '-P', '--builtin-pager', dest='builtin_pager', action='store_true',
+        default=env_builtin_pager.get(),
+        help=('View in the built-in pager instead of less, the header stays on top, '
+              'rows are rendered only when they are scrolled to.'))
     display_group.add_argument(
         '-H', '--auto-header', dest='auto_header', action='store_true',
         help=('Specify that the input CSV file has no header row. '
@@ -133,15 +263,110 @@ def init_parser():
         '--no-wrap', dest='wrap_row', action='store_false',
         default=env_wrap_row.get(),
         help='No wrap for row, if cell width exceeds max, the content will be truncated.')
+    display_group.add_argument(
+        '--word-wrap', dest='word_wrap', action='store_true',
+        help='Break wrapped lines on spaces when possible.')
+    display_group.add_argument(
+        '--stream', dest='stream', action='store_true',
+        default=env_stream.get(),
+        help=('Render rows as they are read, column widths are calculated from the first '
+              'SAMPLE_SIZE rows only, this keeps memory usage constant for huge files.'))
+    display_group.add_argument(
+        '--sample-size', dest='sample_size', type=int, default=1000,
+        help='Number of rows to calculate column widths from in stream mode, default is 1000')
+
+    display_group.add_argument(
+        '--start-column', dest='start_column', type=int, default=1,
+        help='Render columns from this one (1-based), default is 1')
+    display_group.add_argument(
+        '--fit-width', dest='fit_width', type=int, nargs='?', const=0,
+        help=('Only render the columns that fit in this width, '
+              'or the width of the terminal if no value is given.'))
+    display_group.add_argument(
+        '--flush-size', dest='flush_size', type=int, default=64 * 1024,
+        help='Number of characters to buffer before writing to the pager or stdout, default is 65536')
+
+    display_group.add_argument(
+        '-j', '--jobs', dest='jobs', type=int, default=1,
+        help=('Number of processes to render rows in parallel, default is 1. '
+              'For a regular file, column widths are also scanned in parallel.'))
 
     # file options
     file_group = parser.add_argument_group('File options')
     file_group.add_argument(
-        '-e', '--encoding', dest='encoding', default='utf-8',
-        help='Specify the encoding of the input CSV file.')
+        '-e', '--encoding', dest='encoding', default=None,
+        help=('Specify the encoding of the input CSV file, by default it is detected from '
+              'the first 64K of the input: BOM, UTF-8, GB18030, Shift-JIS, Big5 or CP1252.'))
+
+    file_group.add_argument(
+        '--from-row', dest='from_row', type=int, default=1,
+        help=('Start from this row (1-based, header excluded). For a regular file, rows before it '
+              'are skipped by a row index saved next to the file, without being parsed.'))
+    file_group.add_argument(
+        '--config', dest='config', default=env_config.get(),
+        help=('Config file of column profiles for files matching patterns, '
+              'default is ~/.config/csvless/config.json'))
+    file_group.add_argument(
+        '--no-cache', dest='no_cache', action='store_true',
+        help='Do not read or write the column widths cache.')
+    file_group.add_argument(
+        '--cache-dir', dest='cache_dir', default=env_cache_dir.get(),
+        help='Directory of the column widths cache, default is ~/.cache/csvless/widths')
+
+    # data options
+    data_group = parser.add_argument_group('Data options')
+    data_group.add_argument(
+        '-c', '--columns', dest='columns',
+        help=('Comma separated columns to show, by header value or #N for the Nth column. '
+              'Other columns are never measured or rendered.'))
+    data_group.add_argument(
+        '--where', dest='where', action='append', default=[],
+        help=('Only show rows matching "COLUMN OP VALUE", OP is one of = != < <= > >= ~ !~ '
+              '(~ means contains). Could be given multiple times.'))
+
+    data_group.add_argument(
+        '--sort', dest='sort', metavar='COLUMN[:desc]',
+        help=('Sort rows by the column, by header value or #N for the Nth column. '
+              'Values are compared as numbers, dates or strings.'))
+    data_group.add_argument(
+        '--sort-memory', dest='sort_memory', type=int, metavar='MB', default=256,
+        help=('Rows are sorted in memory up to this size, larger input is sorted in temp files, '
+              'default is 256'))
+    data_group.add_argument(
+        '--stats', dest='stats', action='store_true',
+        help=('Show the stats of each column instead of the rows: count, nulls, distinct, '
+              'min, max, and sum, mean of numeric columns.'))
+    data_group.add_argument(
+        '--stats-footer', dest='stats_footer', action='store_true',
+        help='Show the stats of each column in a footer row, collected while the rows are read.')
+    limit_group = data_group.add_mutually_exclusive_group()
+    limit_group.add_argument(
+        '--head', dest='head', type=int, metavar='N',
+        help='Only show the first N rows, the rest of the file is not read.')
+    limit_group.add_argument(
+        '--tail', dest='tail', type=int, metavar='N',
+        help=('Only show the last N rows. For a regular file, they are found by '
+              'reading the file backward when possible.'))
+    limit_group.add_argument(
+        '--sample', dest='sample', type=int, metavar='N',
+        help='Only show N rows picked at random, in the order of the file.')
 
     # reader options
     reader_group = parser.add_argument_group('CSV reader options')
+    reader_group.add_argument(
+        '--read-ahead', dest='read_ahead', type=int, metavar='N', default=env_read_ahead.get(),
+        help=('Read and parse rows in a background thread, at most N batches of rows ahead '
+              'of rendering, this helps when input is slow, e.g. a pipe or a network '
+              'filesystem. Default is 0, which reads rows in the main thread.'))
+    reader_group.add_argument(
+        '--reader', dest='reader', choices=backends, default='auto',
+        help=('CSV reader backend, `block` reads and decodes the file in large blocks, '
+              '`stdlib` reads it line by line, default is `auto`, which is `block` '
+              'unless --escapechar is given.'))
+    reader_group.add_argument(
+        '--no-sniff', dest='sniff', action='store_false',
+        help=('Do not detect the delimiter, quote char and whether there is a header '
+              'from the head of the input, those not given are detected by default.'))
     reader_group.add_argument(
         '-d', '--delimiter', dest='delimiter',
         help='Delimiting character of the input CSV file.')
@@ -169,6 +394,13 @@ def init_parser():
 def parse_args(parser, raw_args):
     args = parser.parse_args(raw_args)
 
+    try:
+        args.column_keys = parse_columns(args.columns)
+        args.where_conditions = [parse_where(i) for i in args.where]
+        args.sort_by, args.sort_desc = parse_sort(args.sort)
+    except ValueError as e:
+        parser.error(str(e))
+
     # reader args
     reader_kwgs = get_reader_kwargs(args)
     return args, reader_kwgs
@@ -198,9 +430,191 @@ def get_reader_kwargs(args):
     return kwargs
 
 
-def open_file(path, encoding=None):
-    f = io.open(path, mode='Ur', encoding=encoding)
-    return f
+def index_reader(path, from_row, has_header, encoding, reader_kwargs):
+    """
+    Returns rows from row `from_row` (1-based, not counting the header),
+    parsed from the offsets in the row index of the file instead of all
+    the rows before it. The index is saved next to the file for the next time.
+    """
+    index = RowIndex.load_or_create(
+        path, get_quotechar(reader_kwargs), reader_kwargs.get('delimiter', ','),
+        reader_kwargs.get('skipinitialspace', False))
+    start = from_row - 1
+    header = []
+    if has_header:
+        header = index.read_rows(0, 1, encoding, reader_kwargs)
+        start += 1
+    index.build(until_row=start)
+    index.save()
+    return itertools.chain(header, index.iter_rows(start, encoding, reader_kwargs))
+
+
+def check_columns(parser, args, reader):
+    """
+    Report the columns of --columns, --where and --sort which are not in the header
+    by the parser, before anything is drawn. Returns the rows of `reader`,
+    with the header read from it.
+    """
+    header = []
+    if not args.auto_header:
+        header = next(reader, None)
+        if header is None:
+            return iter([])
+        reader = itertools.chain([header], reader)
+    keys = list(args.column_keys or []) + [key for key, _, _ in args.where_conditions]
+    if args.sort_by is not None:
+        keys.append(args.sort_by)
+    for key in keys:
+        try:
+            resolve_col_key(key, header)
+        except ValueError as e:
+            if header:
+                parser.error('{}, columns are {}'.format(e, ', '.join(header)))
+            parser.error('{}, refer to columns by #N without a header'.format(e))
+    return reader
+
+
+def close_input(f, reader):
+    if isinstance(reader, ThreadedReader):
+        reader.close()
+    f.close()
+
+
+def skip_rows(reader, n, has_header):
+    """
+    Returns the header and the rows after the first `n` rows,
+    for input which can't be read by the row index.
+    """
+    header = []
+    if has_header:
+        header = [next(reader, [])]
+    return itertools.chain(header, itertools.islice(reader, n, None))
+
+
+def tail_reader(reader, path, n, has_header, encoding, reader_kwargs):
+    """
+    Returns the header and the last `n` rows, the rows are parsed from where
+    they start by reading the file backward, instead of reading all the rows.
+    Falls back to `reader` if the start can't be found this way.
+    """
+    if reader_kwargs.get('escapechar'):
+        # escaped newlines can't be told from record ends
+        return reader
+    offset = tail_offset(path, n, get_quotechar(reader_kwargs))
+    if offset is None:
+        return reader
+    header = []
+    if has_header:
+        header = [next(reader, [])]
+        if any('\n' in i or '\r' in i for i in header[0]):
+            # the offset may be in the header
+            return itertools.chain(header, reader)
+
+    def read_tail():
+        with io.open(path, 'rb') as f:
+            f.seek(offset)
+            for row in BlockReader(f, encoding, reader_kwargs):
+                yield row
+
+    return itertools.chain(header, read_tail())
+
+
+def run_pager(args, tb, reader, reader_kwargs, cols_width=None, limited=False, random_access=True):
+    """
+    View the table in the built-in pager, for a regular file, rows are parsed
+    by the row index only when they are scrolled to.
+    """
+    has_header = not args.auto_header
+    header = None
+    index = None
+    if random_access and not tb.columns and not tb.where and not limited and tb.sort_by is None:
+        index = RowIndex.load_or_create(
+            args.file, get_quotechar(reader_kwargs), reader_kwargs.get('delimiter', ','),
+            reader_kwargs.get('skipinitialspace', False))
+        first_record = args.from_row - 1
+        if has_header:
+            header = (index.read_rows(0, 1, args.encoding, reader_kwargs) or [[]])[0]
+            first_record += 1
+        source = IndexRowSource(index, first_record, args.encoding, reader_kwargs)
+    else:
+        reader = tb.select_data(reader, has_header)
+        if tb.sort_by is not None:
+            reader, sorted_cols_width = tb.sort_data(reader, has_header)
+            if cols_width is None and not limited:
+                cols_width = sorted_cols_width
+        reader = iter(tb.limit_data(reader, has_header, args.head, args.tail, args.sample))
+        if has_header:
+            header = next(reader, [])
+        source = StreamRowSource(reader)
+
+    Pager(tb, source, header, cols_width).run()
+    if index is not None:
+        index.save()
+
+
+def parse_column_key(key):
+    """
+    A column is referred to by header value, or `#N` for the Nth column (1-based).
+    """
+    if key.startswith('#') and key[1:].isdigit():
+        return int(key[1:]) - 1
+    return key
+
+
+def parse_columns(value):
+    if not value:
+        return None
+    return [parse_column_key(i.strip()) for i in value.split(',')]
+
+
+where_regex = re.compile(r'^(.+?)\s*(!=|<=|>=|!~|=|<|>|~)\s*(.*)$')
+
+
+def parse_where(value):
+    """
+    Parse `COLUMN OP VALUE` into `(column, op, value)`.
+    """
+    m = where_regex.match(value)
+    if not m:
+        raise ValueError('invalid --where: {!r}, should be COLUMN OP VALUE'.format(value))
+    key, op, v = m.groups()
+    return parse_column_key(key.strip()), op, v
+
+
+def parse_sort(value):
+    """
+    Parse `COLUMN[:desc]` into `(column, desc)`.
+    """
+    if not value:
+        return None, False
+    desc = False
+    key, sep, order = value.rpartition(':')
+    if sep and order in ('asc', 'desc'):
+        desc = order == 'desc'
+    else:
+        key = value
+    return parse_column_key(key.strip()), desc
+
+
+def get_window_width(fit_width):
+    """
+    `--fit-width` without value means the width of the terminal.
+    """
+    if fit_width is None:
+        return None
+    if fit_width == 0:
+        try:
+            from shutil import get_terminal_size
+        except ImportError:
+            return 80
+        return get_terminal_size().columns
+    return fit_width
+
+
+def get_quotechar(reader_kwargs):
+    if reader_kwargs.get('quoting') == csv.QUOTE_NONE:
+        return None
+    return reader_kwargs.get('quotechar', '"')
 
 
 if __name__ == '__main__':
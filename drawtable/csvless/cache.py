@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of column widths, so that reopening a file which has been
+seen before doesn't need to scan it again.
+
+Each entry is a small JSON file in the cache dir, named by the hash of
+the file identity (path, size, mtime) and the options which affect the
+widths. Entries are evicted in least recently used order when the total
+size of the cache dir exceeds `max_size`.
+"""
+
+import os
+import io
+import json
+import hashlib
+import tempfile
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'csvless', 'widths')
+
+
+class WidthCache(object):
+    # bump when the way widths are measured changes
+    version = 1
+    suffix = '.json'
+
+    def __init__(self, cache_dir=None, max_size=4 * 1024 * 1024):
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self, path, **options):
+        """
+        Returns the cache key of the file, or None if it's not a regular file.
+        `options` are those which affect the widths, e.g. reader kwargs.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        identity = [
+            self.version,
+            os.path.abspath(path),
+            st.st_size,
+            st.st_mtime,
+            sorted((k, repr(v)) for k, v in options.items()),
+        ]
+        return hashlib.sha1(json.dumps(identity).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key):
+        """
+        Returns `(cols_width, rowslen)`, or None if not cached.
+        """
+        path = self._path(key)
+        try:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # mark as recently used
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        cols_width = dict((int(k), v) for k, v in entry['cols_width'].items())
+        return cols_width, entry['rowslen']
+
+    def set(self, key, cols_width, rowslen):
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            data = json.dumps({'cols_width': cols_width, 'rowslen': rowslen})
+            # write to a temp file then rename, so that a concurrent reader
+            # never sees a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with io.open(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.rename(tmp_path, self._path(key))
+        except (IOError, OSError):
+            # cache is best effort
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
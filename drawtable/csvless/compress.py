@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Transparent decompression of gzip, bz2 and xz input, detected by magic bytes.
+
+The compressed stream is decompressed in a background thread, in blocks,
+into a bounded queue, so that decompression overlaps with parsing and
+rendering, and memory usage doesn't grow with the size of the file.
+"""
+
+import io
+import bz2
+import gzip
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+BLOCK_SIZE = 256 * 1024
+# number of decompressed blocks buffered ahead of the reader
+QUEUE_SIZE = 8
+
+magic_numbers = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+]
+
+
+def detect_compression(f):
+    """
+    Returns the compression of the buffered binary stream `f`, or None.
+    Nothing is consumed from `f`.
+    """
+    head = f.peek(8)[:8]
+    for magic, name in magic_numbers:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def is_compressed(path):
+    try:
+        with io.open(path, 'rb') as f:
+            return detect_compression(f) is not None
+    except (IOError, OSError):
+        return False
+
+
+def decompressed_file(name, f):
+    if name == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    if name == 'bz2':
+        return bz2.BZ2File(f, mode='rb')
+    if name == 'xz':
+        if lzma is None:
+            raise ValueError('xz input is not supported, lzma module is missing')
+        return lzma.LZMAFile(f, mode='rb')
+    raise ValueError('unknown compression: {}'.format(name))
+
+
+class ThreadedDecompressor(io.RawIOBase):
+    """
+    A readable raw stream of the decompressed data of `f`,
+    wrap it with `io.BufferedReader` to use it as a file.
+    """
+    def __init__(self, name, f, block_size=BLOCK_SIZE, queue_size=QUEUE_SIZE):
+        self.f = f
+        self.block_size = block_size
+        self.queue = queue.Queue(queue_size)
+        self.chunk = b''
+        self.pos = 0
+        self.eof = False
+        self.stopped = threading.Event()
+        # errors are raised in the thread reading the blocks
+        self.thread = threading.Thread(target=self._run, args=(decompressed_file(name, f),))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, df):
+        try:
+            while True:
+                block = df.read(self.block_size)
+                if not self._put(block) or not block:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.pos >= len(self.chunk):
+            if self.eof:
+                return 0
+            item = self.queue.get()
+            if isinstance(item, Exception):
+                self.eof = True
+                raise item
+            if not item:
+                self.eof = True
+                return 0
+            self.chunk = item
+            self.pos = 0
+        n = min(len(b), len(self.chunk) - self.pos)
+        b[:n] = self.chunk[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.f.close()
+        super(ThreadedDecompressor, self).close()
+
+
+def open_binary(path):
+    """
+    Open the file for reading in binary, decompressed if it's compressed.
+    Returns `(f, compression)`.
+    """
+    # large enough to peek the prefix for sniffing the encoding
+    f = io.open(path, 'rb', buffering=BLOCK_SIZE)
+    try:
+        name = detect_compression(f)
+    except (IOError, OSError):
+        name = None
+    if name is None:
+        return f, None
+    return io.BufferedReader(ThreadedDecompressor(name, f), BLOCK_SIZE), name
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Column config profiles for files matching glob patterns.
+
+The config file is JSON, profiles are matched in order against the path
+and the file name of the CSV file, the first matched profile is used:
+
+    {
+        "profiles": [
+            {
+                "pattern": "daily_report_*.csv",
+                "columns": {
+                    "id": {"fixed": 8},
+                    "#2": {"max": 40, "min": 10, "align": "right"},
+                    "notes": {"hidden": true}
+                }
+            }
+        ]
+    }
+
+Columns are referred to by header value, or by `#N` for the Nth column (1-based).
+"""
+
+import io
+import os
+import json
+import fnmatch
+
+
+column_config_keys = ('max', 'min', 'fixed', 'hidden', 'align')
+
+
+def default_config_path():
+    base = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(base, 'csvless', 'config.json')
+
+
+def load_config(path):
+    """
+    Returns the config dict, an empty one if the file doesn't exist.
+    """
+    try:
+        with io.open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return {}
+    except ValueError as e:
+        raise ValueError('invalid config file {}: {}'.format(path, e))
+
+
+def match_profile(config, file_path):
+    """
+    Returns the columns of the first profile whose pattern matches `file_path`, or None.
+    """
+    name = os.path.basename(file_path)
+    for profile in config.get('profiles', []):
+        pattern = profile.get('pattern')
+        if not pattern:
+            continue
+        if fnmatch.fnmatch(file_path, pattern) or fnmatch.fnmatch(name, pattern):
+            return profile.get('columns', {})
+    return None
+
+
+def get_table_options(columns):
+    """
+    Converts the columns of a profile into `cols_config` and `cols_align`
+    options of `Table`.
+    """
+    cols_config = {}
+    cols_align = {}
+    for key, conf in columns.items():
+        unknown = set(conf) - set(column_config_keys)
+        if unknown:
+            raise ValueError('unknown column config {} for {}'.format(sorted(unknown), key))
+        if key.startswith('#') and key[1:].isdigit():
+            key = int(key[1:]) - 1
+        conf = dict(conf)
+        align = conf.pop('align', None)
+        if align is not None:
+            cols_align[key] = align
+        if conf:
+            cols_config[key] = conf
+    return cols_config, cols_align
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Dialect detection from a sample of the head of the input.
+
+The sample is the prefix already peeked for sniffing the encoding, so
+nothing is read twice. Only the options which are not given explicitly are
+detected, and a guess is only taken when the sample is clear about it.
+"""
+
+import io
+import csv
+import re
+from drawtable import numeric_regex
+
+
+delimiters = (',', '\t', ';', '|')
+quotechars = ('"', "'")
+
+# max number of rows of the sample to parse
+SAMPLE_ROWS = 200
+
+
+def complete_lines(text):
+    """
+    Cut `text` after its last newline, the last line may be incomplete.
+    """
+    cut = text.rfind('\n')
+    if cut == -1:
+        return text
+    return text[:cut + 1]
+
+
+def parse_sample(sample, **reader_kwargs):
+    reader = csv.reader(io.StringIO(sample, newline=''), **reader_kwargs)
+    rows = []
+    try:
+        for row in reader:
+            if row:
+                rows.append(row)
+            if len(rows) >= SAMPLE_ROWS:
+                break
+    except csv.Error:
+        pass
+    return rows
+
+
+def _consistency(rows):
+    """
+    Returns `(fields, ratio)`, the most common number of fields
+    in the rows, and the ratio of rows having it.
+    """
+    counts = {}
+    for row in rows:
+        counts[len(row)] = counts.get(len(row), 0) + 1
+    fields, count = max(counts.items(), key=lambda x: (x[1], x[0]))
+    return fields, count / float(len(rows))
+
+
+def sniff_quotechar(sample, delimiter):
+    """
+    The quote char which starts the most fields, or None if no field is quoted.
+
+    A quote char other than `"` is only taken if the rows parsed with it have
+    consistent numbers of fields, as a leading apostrophe is often just text.
+    """
+    best, best_count = None, 0
+    for q in quotechars:
+        pattern = r'(?:^|{}){}'.format(re.escape(delimiter), re.escape(q))
+        count = len(re.findall(pattern, sample, re.M))
+        if count > best_count:
+            best, best_count = q, count
+    if best is not None and best != '"':
+        _, ratio = _consistency(parse_sample(sample, delimiter=delimiter, quotechar=best))
+        _, default_ratio = _consistency(parse_sample(sample, delimiter=delimiter))
+        if ratio < 0.9 or ratio < default_ratio:
+            return '"'
+    return best
+
+
+def sniff_delimiter(sample, quotechars=quotechars):
+    """
+    The delimiter which splits the rows into the same number of fields,
+    more than one, the most consistently, with any of `quotechars`,
+    or None if no delimiter does.
+    """
+    best, best_score = None, (0, 0)
+    for d in delimiters:
+        for q in quotechars:
+            rows = parse_sample(sample, delimiter=d, quotechar=q)
+            if not rows:
+                continue
+            fields, ratio = _consistency(rows)
+            if fields < 2:
+                continue
+            score = (ratio, fields)
+            if score > best_score:
+                best, best_score = d, score
+    # most rows should agree
+    if best_score[0] < 0.9:
+        return None
+    return best
+
+
+def sniff_header(rows):
+    """
+    Returns True if the first row looks like a header, False if it looks
+    like data, None if it can't be told.
+
+    A column votes for a header if its values are numbers but the first is not,
+    and against it if the first value is a number as well. Data rows don't have
+    text in a column of numbers, so any vote for a header decides it, e.g. the
+    header `id,2019,2020` of columns of numbers.
+    """
+    if len(rows) < 2:
+        return None
+    first, rest = rows[0], rows[1:]
+    votes_for, votes_against = 0, 0
+    for index, value in enumerate(first):
+        values = [row[index] for row in rest if index < len(row) and row[index]]
+        if not values:
+            continue
+        numeric = sum(1 for i in values if numeric_regex.match(i))
+        if numeric < len(values) * 0.9:
+            continue
+        if numeric_regex.match(value):
+            votes_against += 1
+        elif value:
+            votes_for += 1
+    if votes_for:
+        return True
+    if votes_against:
+        return False
+    return None
+
+
+def sniff_dialect(sample, reader_kwargs=None):
+    """
+    Returns `(reader_kwargs, has_header)`, `reader_kwargs` are the options
+    given, with the delimiter and quotechar detected from `sample` if they
+    are not given, `has_header` is None if it can't be told.
+    """
+    kwargs = dict(reader_kwargs or {})
+    sample = complete_lines(sample)
+    if not sample:
+        return kwargs, None
+
+    quote_none = kwargs.get('quoting') == csv.QUOTE_NONE
+    if 'delimiter' not in kwargs:
+        # a quoted delimiter only splits with the right quote char
+        given = kwargs.get('quotechar')
+        delimiter = sniff_delimiter(sample, (given,) if given else quotechars)
+        if delimiter is not None and delimiter != ',':
+            kwargs['delimiter'] = delimiter
+    if 'quotechar' not in kwargs and not quote_none:
+        quotechar = sniff_quotechar(sample, kwargs.get('delimiter', ','))
+        if quotechar is not None and quotechar != '"':
+            kwargs['quotechar'] = quotechar
+
+    rows = parse_sample(sample, **kwargs)
+    return kwargs, sniff_header(rows)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Encoding detection from a bounded prefix of the input.
+
+A BOM decides the encoding, otherwise UTF-8 is used if the prefix is valid
+UTF-8, otherwise the legacy encoding which decodes the prefix into the most
+plausible text, Latin-1 is the last resort as it decodes anything.
+"""
+
+import codecs
+
+
+SNIFF_SIZE = 64 * 1024
+
+# the longer BOMs first, as the UTF-32 LE BOM starts with the UTF-16 LE BOM
+boms = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def _gb_common(b):
+    # GB2312 symbols and hanzi
+    return len(b) == 2 and (0xa1 <= b[0] <= 0xa9 or 0xb0 <= b[0] <= 0xf7) and b[1] >= 0xa1
+
+
+def _sjis_common(b):
+    # JIS symbols, kana and kanji
+    return len(b) == 2 and (0x81 <= b[0] <= 0x84 or 0x88 <= b[0] <= 0x9f or 0xe0 <= b[0] <= 0xea)
+
+
+def _big5_common(b):
+    # symbols and hanzi
+    return len(b) == 2 and 0xa1 <= b[0] <= 0xf9
+
+
+# candidates tried in order when the prefix isn't UTF-8, with whether the
+# encoded bytes of a char are in the commonly used part of the encoding,
+# as text in one encoding often decodes into rare chars in another
+legacy_encodings = [
+    ('gb18030', _gb_common),
+    ('shift_jis', _sjis_common),
+    ('big5', _big5_common),
+]
+
+
+def decode_prefix(data, encoding):
+    """
+    Decode `data` which may end in the middle of a char, returns None if it's invalid.
+    """
+    try:
+        return codecs.getincrementaldecoder(encoding)().decode(data, False)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+def _plausibility(text, encoding, is_common):
+    non_ascii = [c for c in text if ord(c) > 0x7f]
+    if not non_ascii:
+        return 1.0
+    common = sum(1 for c in non_ascii if is_common(bytearray(c.encode(encoding))))
+    return common / float(len(non_ascii))
+
+
+def sniff_encoding(data):
+    """
+    Returns the encoding of `data`, a prefix of the input.
+    """
+    for bom, encoding in boms:
+        if data.startswith(bom):
+            return encoding
+    if decode_prefix(data, 'utf-8') is not None:
+        return 'utf-8'
+
+    best, best_score = None, 0
+    for encoding, is_common in legacy_encodings:
+        text = decode_prefix(data, encoding)
+        if text is None:
+            continue
+        score = _plausibility(text, encoding, is_common)
+        if score > best_score:
+            best, best_score = encoding, score
+    # most of the chars should be common, or it's more likely a western encoding
+    if best is not None and best_score >= 0.6:
+        return best
+    if decode_prefix(data, 'cp1252') is not None:
+        return 'cp1252'
+    return 'latin-1'
+
+
+def check_encoding(data, encoding):
+    """
+    Raise `ValueError` if `data`, a prefix of the input, is not valid in `encoding`,
+    or `encoding` is unknown.
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)()
+    except LookupError:
+        raise ValueError('unknown encoding {}'.format(encoding))
+    try:
+        decoder.decode(data, False)
+    except UnicodeDecodeError as e:
+        raise ValueError('input is not valid {} at byte {}, it looks like {}'.format(
+            encoding, e.start, sniff_encoding(data)))
+
+
+def is_ascii_compatible(encoding):
+    """
+    Whether newlines and quotes are single ASCII bytes in the encoding, so that
+    records could be found by scanning the bytes, e.g. not UTF-16.
+    """
+    try:
+        encoder = codecs.getincrementalencoder(encoding)()
+    except LookupError:
+        return False
+    # a BOM may come with the first output
+    encoder.encode(u'a')
+    return encoder.encode(u'\n"') == b'\n"'
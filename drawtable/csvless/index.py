@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Random access row index for CSV files.
+
+The index is an `array('Q')` of the byte offsets where records start, built by
+scanning the memory-mapped file for newlines which are not quoted. With the
+index, any range of rows can be parsed without parsing the rows before it.
+
+The index can be built incrementally (e.g. only as far as the pager has
+scrolled to), and saved next to the CSV file to be reused.
+"""
+
+import io
+import os
+import mmap
+import struct
+from array import array
+from drawtable.csvless.readers import RecordScanner, parse_text
+
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def tail_offset(path, n, quotechar='"'):
+    """
+    Returns the offset where the last `n` records start, found by reading
+    the file backward, or None if the file has no more than `n` records.
+
+    A newline in the tail can't be told to be quoted or not without reading
+    from the start, so None is also returned if there is any quote char in
+    the tail, the caller should read the file from the start then.
+    """
+    quote = quotechar.encode('ascii') if quotechar else None
+    size = os.path.getsize(path)
+    count = 0
+    with io.open(path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            start = max(0, pos - BLOCK_SIZE)
+            f.seek(start)
+            block = f.read(pos - start)
+            end = len(block)
+            if pos == size and block.endswith(b'\n'):
+                # the newline ending the last record
+                end -= 1
+            while True:
+                nl = block.rfind(b'\n', 0, end)
+                if nl == -1:
+                    break
+                count += 1
+                if count == n:
+                    if quote and quote in block[nl + 1:]:
+                        return None
+                    return start + nl + 1
+                end = nl
+            if quote and quote in block:
+                return None
+            pos = start
+    return None
+
+
+class RowIndex(object):
+    """
+    Usage:
+    >>> index = RowIndex.load_or_create('foo.csv')
+    >>> index.build(until_row=5000001)
+    >>> rows = index.read_rows(5000000, 5000050)
+    >>> index.save()
+
+    Records are found by `RecordScanner`, which handles quotes escaped by
+    doubling them. Pass `quotechar=None` for files without quoting.
+    """
+    magic = b'CSVLIDX3'
+    # magic, quotechar, delimiter, skipinitialspace, size, mtime, scanned, scanner state
+    header_struct = struct.Struct('<8scc?QdQB')
+    suffix = '.csvless-index'
+
+    def __init__(self, path, quotechar='"', delimiter=',', skipinitialspace=False):
+        self.path = path
+        self.quote = quotechar.encode('ascii') if quotechar else None
+        self.delimiter = delimiter.encode('ascii')
+        self.skipinitialspace = bool(skipinitialspace)
+        st = os.stat(path)
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.offsets = array('Q')
+        if self.size:
+            self.offsets.append(0)
+        # the position till where the file has been scanned
+        self.scanned = 0
+        self.scanner = RecordScanner(self.quote, self.delimiter, b'\n', self.skipinitialspace)
+
+    def __len__(self):
+        """
+        Number of records indexed so far, the last one may be incomplete
+        if the index is not fully built.
+        """
+        return len(self.offsets)
+
+    @property
+    def complete(self):
+        return self.scanned >= self.size
+
+    def build(self, until_row=None):
+        """
+        Scan the file from where the last build stopped, until more than
+        `until_row` records are indexed, or the end of the file.
+        """
+        if self.complete or (until_row is not None and len(self.offsets) > until_row):
+            return
+        offsets = self.offsets
+        scanner = self.scanner
+        with io.open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                pos = self.scanned
+                while pos < self.size:
+                    block = mm[pos:pos + BLOCK_SIZE]
+                    for end in scanner.ends(block):
+                        if pos + end < self.size:
+                            offsets.append(pos + end)
+                    pos += len(block)
+                    if until_row is not None and len(offsets) > until_row:
+                        break
+            finally:
+                mm.close()
+        self.scanned = pos
+
+    def record_range(self, start, stop):
+        """
+        Returns the byte range of records `[start, stop)`, the index must
+        have been built past `stop`.
+        """
+        begin = self.offsets[start]
+        if stop < len(self.offsets):
+            end = self.offsets[stop]
+        else:
+            end = self.size
+        return begin, end
+
+    def read_rows(self, start, stop, encoding='utf-8', reader_kwargs=None):
+        """
+        Parse records `[start, stop)` into rows, builds the index as far as needed.
+        """
+        self.build(until_row=stop)
+        stop = min(stop, len(self.offsets))
+        if start >= stop:
+            return []
+        begin, end = self.record_range(start, stop)
+        with io.open(self.path, 'rb') as f:
+            f.seek(begin)
+            data = f.read(end - begin)
+        return parse_text(data.decode(encoding), reader_kwargs)
+
+    def iter_rows(self, start, encoding='utf-8', reader_kwargs=None, batch_size=1000):
+        """
+        Iterate rows from record `start` till the end, in batches of `batch_size` records.
+        """
+        while True:
+            rows = self.read_rows(start, start + batch_size, encoding, reader_kwargs)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            start += batch_size
+
+    @classmethod
+    def index_path(cls, path):
+        return path + cls.suffix
+
+    def save(self, index_path=None):
+        """
+        Save the index next to the CSV file, returns False if it can't be written.
+        """
+        if index_path is None:
+            index_path = self.index_path(self.path)
+        try:
+            with io.open(index_path, 'wb') as f:
+                f.write(self.header_struct.pack(
+                    self.magic, self.quote or b'\0', self.delimiter, self.skipinitialspace,
+                    self.size, self.mtime, self.scanned, self.scanner.state))
+                self.offsets.tofile(f)
+        except (IOError, OSError):
+            return False
+        return True
+
+    @classmethod
+    def load_or_create(cls, path, quotechar='"', delimiter=',', skipinitialspace=False, index_path=None):
+        """
+        Load the saved index of the CSV file, if it's missing or outdated,
+        returns a new index which is not built yet.
+        """
+        index = cls(path, quotechar, delimiter, skipinitialspace)
+        if index_path is None:
+            index_path = cls.index_path(path)
+        try:
+            with io.open(index_path, 'rb') as f:
+                header = f.read(cls.header_struct.size)
+                magic, quote, delimiter, skipinitialspace, size, mtime, scanned, state = \
+                    cls.header_struct.unpack(header)
+                if magic != cls.magic or quote != (index.quote or b'\0') or \
+                        delimiter != index.delimiter or skipinitialspace != index.skipinitialspace or \
+                        size != index.size or mtime != index.mtime:
+                    return index
+                offsets = array('Q')
+                data = f.read()
+                offsets.frombytes(data)
+        except (IOError, OSError, struct.error, ValueError):
+            return index
+        index.offsets = offsets
+        index.scanned = scanned
+        index.scanner.state = state
+        return index
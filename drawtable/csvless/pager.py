@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Built-in curses pager with a frozen header.
+
+Only the rows in the viewport are parsed and rendered, as the user scrolls.
+Rows come from a row source, either random access by a `RowIndex`,
+or read from an iterator as far as the user has scrolled to.
+"""
+
+import io
+import csv
+import tempfile
+import itertools
+from array import array
+from drawtable import update_cols_width, detect_numeric_cols
+from drawtable.width import slice_str
+
+
+class StreamRowSource(object):
+    """
+    Rows read from an iterator, only as far as they are requested.
+
+    The last `window_size` rows read are kept in memory, the rows before them
+    are spilled to a temp file in blocks of `block_size` rows, so that the user
+    can scroll back, while memory doesn't grow with the rows read.
+    """
+    window_size = 10000
+    block_size = 1000
+
+    def __init__(self, rows):
+        self.it = iter(rows)
+        # rows from `window_start`
+        self.window = []
+        self.window_start = 0
+        self.exhausted = False
+        self.spill_file = None
+        # offset of each spilled block in the spill file
+        self.block_offsets = array('Q')
+        self.cached_block = (None, None)
+
+    def __len__(self):
+        return self.window_start + len(self.window)
+
+    def _fetch(self, stop):
+        while not self.exhausted and len(self) < stop:
+            need = min(stop - len(self), self.window_size)
+            fetched = list(itertools.islice(self.it, need))
+            self.window.extend(fetched)
+            if len(fetched) < need:
+                self.exhausted = True
+            while len(self.window) > self.window_size + self.block_size:
+                self._spill()
+
+    def _spill(self):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+        f = self.spill_file
+        f.seek(0, io.SEEK_END)
+        self.block_offsets.append(f.tell())
+        csv.writer(f).writerows(self.window[:self.block_size])
+        del self.window[:self.block_size]
+        self.window_start += self.block_size
+
+    def _read_block(self, block):
+        if self.cached_block[0] != block:
+            f = self.spill_file
+            f.seek(self.block_offsets[block])
+            self.cached_block = (block, list(itertools.islice(csv.reader(f), self.block_size)))
+        return self.cached_block[1]
+
+    def get_rows(self, start, stop):
+        self._fetch(stop)
+        stop = min(stop, len(self))
+        rows = []
+        while start < stop:
+            if start >= self.window_start:
+                rows.extend(self.window[start - self.window_start:stop - self.window_start])
+                break
+            block, offset = divmod(start, self.block_size)
+            block_rows = self._read_block(block)[offset:offset + stop - start]
+            rows.extend(block_rows)
+            start += len(block_rows)
+        return rows
+
+    def count(self):
+        while not self.exhausted:
+            self._fetch(len(self) + self.window_size)
+        return len(self)
+
+
+class IndexRowSource(object):
+    """
+    Rows parsed on demand from the offsets of a `RowIndex`,
+    `first_record` is the record of the first row, e.g. 1 to skip header.
+    """
+    def __init__(self, index, first_record=0, encoding='utf-8', reader_kwargs=None):
+        self.index = index
+        self.first_record = first_record
+        self.encoding = encoding
+        self.reader_kwargs = reader_kwargs
+
+    def get_rows(self, start, stop):
+        return self.index.read_rows(
+            self.first_record + start, self.first_record + stop, self.encoding, self.reader_kwargs)
+
+    def count(self):
+        self.index.build()
+        return max(0, len(self.index) - self.first_record)
+
+
+class Pager(object):
+    # number of rendered rows to keep for scrolling back and forth
+    cache_size = 1000
+    # number of rows parsed from the source at a time
+    batch_size = 100
+    scroll_x_step = 8
+
+    def __init__(self, table, source, header=None, cols_width=None):
+        """
+        If `cols_width` is not given, it's calculated from the first
+        `table.sample_size` rows. If `header` is None, auto header is used.
+        """
+        self.table = table
+        self.source = source
+        sample = []
+        if cols_width is None or table.align_numeric:
+            sample = source.get_rows(0, table.sample_size)
+        if cols_width is None:
+            cols_width = {}
+            for row in sample:
+                update_cols_width(cols_width, row)
+        else:
+            cols_width = dict(cols_width)
+        if header is None:
+            header = table.get_auto_header_values(len(cols_width))
+        numeric_cols = None
+        if table.align_numeric:
+            numeric_cols = detect_numeric_cols(sample, len(cols_width))
+        self.header = header
+        self.numeric_cols = numeric_cols
+        self.cols_width = cols_width
+        # lay out all the columns to know where each starts, then only those
+        # on the screen are laid out and rendered, see `prepare_window`
+        start_col = table.window_start_col
+        table.window_start_col, table.window_width = 0, None
+        self.cols_num, cells_width = table.prepare_layout(header, cols_width, numeric_cols)
+        ts = table.table_style
+        x = self.prefix_width = len(ts.char_line_left) + (len(table.row_number_empty) if table.row_numbers else 0)
+        self.cols_x = []
+        for index, cell_width in zip(table.visible_cols, cells_width):
+            self.cols_x.append((index, x))
+            x += cell_width + len(ts.char_line_middle)
+        self.window = None
+        self.header_lines = []
+        self.footer_lines = []
+
+        self.rendered = {}
+        self.rows_count = None
+        self.top = 0
+        self.left = 0
+        for index, x in self.cols_x:
+            if index >= start_col:
+                self.left = x - self.prefix_width
+                break
+
+    def prepare_window(self, width):
+        """
+        Lay out the columns on a screen of `width` from `self.left`, if they
+        change, returns where `self.left` is in the rendered lines.
+        """
+        table = self.table
+        # the first column starts after the prefix, in any window
+        start_col, start_x = 0, self.prefix_width
+        for index, x in self.cols_x:
+            if x > self.left and index != self.cols_x[0][0]:
+                break
+            start_col, start_x = index, x
+        offset = self.left - start_x + self.prefix_width
+        # a column ending on the screen is followed by another one, so that
+        # its border is that between columns
+        window = (start_col, offset + width + 1)
+        if window != self.window:
+            self.window = window
+            table.window_start_col, table.window_width = window
+            _, cells_width = table.prepare_layout(self.header, self.cols_width, self.numeric_cols)
+            self.header_lines = table.draw_header_str(
+                self.header, self.cols_num, self.cols_width, cells_width).split('\n')
+            self.footer_lines = []
+            if table.table_style.has_footer:
+                self.footer_lines = [table.format_line(table.table_style.draw_footer(cells_width))]
+            self.rendered.clear()
+        return offset
+
+    def row_lines(self, index):
+        """
+        Rendered lines of row `index` (0-based), with the sep before it,
+        or None if there is no such row.
+        """
+        try:
+            return self.rendered[index]
+        except KeyError:
+            pass
+        if len(self.rendered) >= self.cache_size:
+            self.rendered.clear()
+        start = index - index % self.batch_size
+        rows = self.source.get_rows(start, start + self.batch_size)
+        if index - start >= len(rows):
+            return None
+        for i, row in enumerate(rows):
+            row_strs = self.table.draw_rows([row], start + i, self.cols_num, self.cols_width)
+            self.rendered[start + i] = '\n'.join(row_strs).split('\n')
+        return self.rendered[index]
+
+    def body_lines(self, height):
+        """
+        Returns `(lines, rows_shown)` of the body from `self.top`.
+        """
+        lines = []
+        index = self.top
+        while len(lines) < height:
+            row_lines = self.row_lines(index)
+            if row_lines is None:
+                lines.extend(self.footer_lines)
+                break
+            lines.extend(row_lines)
+            index += 1
+        return lines[:height], index - self.top
+
+    def screen_lines(self, height, width):
+        """
+        Lines on a screen of `height` x `width`, header lines are always on top.
+        """
+        offset = self.prepare_window(width)
+        header_lines = self.header_lines[:height]
+        body, _ = self.body_lines(height - len(header_lines))
+        return [slice_str(i, offset, width) for i in header_lines + body]
+
+    def count(self):
+        if self.rows_count is None:
+            self.rows_count = self.source.count()
+        return self.rows_count
+
+    def scroll(self, rows):
+        self.top = max(0, self.top + rows)
+        if self.row_lines(self.top) is None:
+            self.top = max(0, self.count() - 1)
+
+    def run(self):
+        import curses
+        curses.wrapper(self._loop)
+
+    def _loop(self, stdscr):
+        import curses
+
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        while True:
+            height, width = stdscr.getmaxyx()
+            stdscr.erase()
+            for y, line in enumerate(self.screen_lines(height, width)):
+                try:
+                    stdscr.addstr(y, 0, line)
+                except curses.error:
+                    # writing to the bottom right corner raises error
+                    pass
+            stdscr.refresh()
+            # the header lines are those of the columns on the screen
+            body_height = max(1, height - len(self.header_lines))
+
+            key = stdscr.getch()
+            if key in (ord('q'), 27):
+                break
+            elif key in (ord('j'), curses.KEY_DOWN, 10):
+                self.scroll(1)
+            elif key in (ord('k'), curses.KEY_UP):
+                self.scroll(-1)
+            elif key in (ord(' '), ord('f'), curses.KEY_NPAGE):
+                _, rows_shown = self.body_lines(body_height)
+                self.scroll(max(1, rows_shown))
+            elif key in (ord('b'), curses.KEY_PPAGE):
+                _, rows_shown = self.body_lines(body_height)
+                self.scroll(-max(1, rows_shown))
+            elif key in (ord('g'), curses.KEY_HOME):
+                self.top = 0
+            elif key in (ord('G'), curses.KEY_END):
+                self.top = max(0, self.count() - 1)
+            elif key in (ord('l'), curses.KEY_RIGHT):
+                self.left += self.scroll_x_step
+            elif key in (ord('h'), curses.KEY_LEFT):
+                self.left = max(0, self.left - self.scroll_x_step)
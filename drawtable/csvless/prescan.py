@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel column width pre-scan for regular CSV files.
+
+The file is split into byte ranges at line starts near evenly spaced split
+points, each range is parsed by a worker process which returns the max width
+of each column, then the results are merged into the `cols_width` for
+`Table.draw`.
+
+A line start may be inside a quoted field, which can't be told without
+parsing from the start of the file. Instead each worker parses from its start
+till the first record which ends at or after the end of its range, and
+reports where that is, so a range is only trusted if it starts where the
+records of the range before end. A range which doesn't is parsed again from
+there, which is rare as split points seldom fall in multi-line fields.
+"""
+
+import io
+import os
+import csv
+import multiprocessing
+from drawtable import update_cols_width
+
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def _next_line_start(f, pos, size):
+    """
+    Returns the offset after the first newline from `pos`, or `size` if there's none.
+    """
+    f.seek(pos)
+    while True:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            return size
+        nl = block.find(b'\n')
+        if nl != -1:
+            return pos + nl + 1
+        pos += len(block)
+
+
+def split_ranges(path, n):
+    """
+    Split the file into at most `n` byte ranges `(start, end)`, each starts
+    at the beginning of a line, which is not necessarily that of a record.
+    """
+    size = os.path.getsize(path)
+    offsets = [0]
+    with io.open(path, 'rb') as f:
+        for i in range(1, n):
+            target = size * i // n
+            if target <= offsets[-1]:
+                continue
+            start = _next_line_start(f, target, size)
+            if start >= size:
+                break
+            if start > offsets[-1]:
+                offsets.append(start)
+    offsets.append(size)
+    return [(offsets[i], offsets[i + 1]) for i in range(len(offsets) - 1)]
+
+
+def _lines(f, encoding, consumed):
+    for line in f:
+        consumed[0] += len(line)
+        yield line.decode(encoding)
+
+
+def scan_range(path, start, end, encoding='utf-8', skip_header=False, reader_kwargs=None):
+    """
+    Returns `(cols_width, rowslen, stop)` of the records from `start`, till
+    the first record which ends at or after `end`, `stop` is where it ends.
+
+    The records are parsed by `csv.reader` as lines are read, so memory
+    doesn't grow with the size of the range.
+    """
+    cols_width = {}
+    rowslen = 0
+    # bytes consumed by the reader, `csv.reader` reads no line after a record
+    consumed = [start]
+    if start >= end:
+        return cols_width, rowslen, start
+    with io.open(path, 'rb') as f:
+        f.seek(start)
+        reader = csv.reader(_lines(f, encoding, consumed), **(reader_kwargs or {}))
+        if skip_header:
+            next(reader, None)
+        for row in reader:
+            rowslen += 1
+            update_cols_width(cols_width, row)
+            if consumed[0] >= end:
+                break
+    return cols_width, rowslen, consumed[0]
+
+
+def _scan_range_args(args):
+    try:
+        return scan_range(*args)
+    except csv.Error:
+        # a range which starts inside a quoted field may not parse, it's parsed
+        # again from where the record starts, errors of valid ranges are raised then
+        return None
+
+
+def prescan_cols_width(path, workers, encoding='utf-8', has_header=True, reader_kwargs=None):
+    """
+    Returns `(cols_width, rowslen)` of the whole file, scanned by `workers`
+    processes in parallel.
+    """
+    ranges = split_ranges(path, workers)
+    tasks = [(path, start, end, encoding, has_header and index == 0, reader_kwargs)
+             for index, (start, end) in enumerate(ranges)]
+    if len(tasks) == 1:
+        results = [_scan_range_args(tasks[0])]
+    else:
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            results = pool.map(_scan_range_args, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    cols_width = {}
+    rowslen = 0
+    # where the records parsed so far end
+    pos = 0
+    for task, result in zip(tasks, results):
+        start, end = task[1], task[2]
+        if end <= pos:
+            # the records of the range before went past this range
+            continue
+        if start != pos or result is None:
+            # the range started inside a record, parse it again from where the record starts
+            result = scan_range(path, pos, end, encoding, False, reader_kwargs)
+        range_cols_width, range_rowslen, pos = result
+        rowslen += range_rowslen
+        for index, w in range_cols_width.items():
+            if w > cols_width.get(index, -1):
+                cols_width[index] = w
+    return cols_width, rowslen
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+CSV reader backends for csvless.
+
+- `stdlib`: `csv.reader` over the file opened in text mode, line by line.
+- `block`: reads the file in large binary blocks, decodes each block once,
+  and parses the complete records in it as a batch. Records without any
+  quote char are split by the delimiter directly, other records are parsed
+  by `csv.reader`.
+
+Both take the dialect options from `get_reader_kwargs`, and yield the same rows.
+
+`ThreadedReader` reads the rows of either backend in a background thread.
+"""
+
+import io
+import csv
+import codecs
+import itertools
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from drawtable.csvless.compress import open_binary
+from drawtable.csvless.encoding import SNIFF_SIZE, sniff_encoding, check_encoding, decode_prefix
+
+
+# small enough that the rows of a block don't trigger the cyclic GC too often
+BLOCK_SIZE = 16 * 1024
+
+backends = ('auto', 'stdlib', 'block')
+
+
+def can_split(reader_kwargs):
+    """
+    Whether records without quote chars could be split by the delimiter,
+    the same as `csv.reader` parses them.
+    """
+    return not (
+        reader_kwargs.get('escapechar') or reader_kwargs.get('skipinitialspace') or
+        reader_kwargs.get('quoting') == csv.QUOTE_NONNUMERIC)
+
+
+def parse_text(text, reader_kwargs=None):
+    """
+    Parse complete records in `text` into a list of rows.
+    """
+    reader_kwargs = reader_kwargs or {}
+    quoting = reader_kwargs.get('quoting')
+    quote = None if quoting == csv.QUOTE_NONE else reader_kwargs.get('quotechar', '"')
+    if can_split(reader_kwargs) and (quote is None or quote not in text) and \
+            text.count('\r') == text.count('\r\n'):
+        delimiter = reader_kwargs.get('delimiter', ',')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n')
+        lines = text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        # csv.reader returns an empty row for a blank line
+        return [line.split(delimiter) if line else [] for line in lines]
+    return list(csv.reader(io.StringIO(text, newline=''), **reader_kwargs))
+
+
+# states of `RecordScanner`, as those of `csv.reader`
+START_FIELD, IN_FIELD, IN_QUOTED_FIELD, QUOTE_IN_QUOTED_FIELD = range(4)
+
+
+class RecordScanner(object):
+    """
+    Finds the newlines which end records, in str or bytes data fed in order.
+
+    Quotes are tracked the way `csv.reader` does, a quote char only starts
+    a quoted field at the start of a field, elsewhere it's a literal char,
+    so a stray quote like `5" screen` doesn't affect the records after it.
+    Quotes escaped by doubling them are handled, `escapechar` is not.
+
+    `quote`, `delimiter` and `newline` are of the same type as the data,
+    pass `quote=None` for data without quoting.
+    """
+    def __init__(self, quote, delimiter, newline, skipinitialspace=False):
+        self.quote = quote
+        self.delimiter = delimiter
+        self.newline = newline
+        self.space = b' ' if isinstance(newline, bytes) else u' '
+        self.skipinitialspace = skipinitialspace
+        self.state = START_FIELD
+
+    def _at_field_start(self, data, pos, start, state):
+        """
+        Whether `pos` is at the start of a field, `state` is the state at `start`.
+        """
+        i = pos
+        if self.skipinitialspace:
+            while i > start and data[i - 1:i] == self.space:
+                i -= 1
+        if i == start:
+            return state == START_FIELD
+        return data[i - 1:i] in (self.delimiter, self.newline)
+
+    def unquoted_spans(self, data, pos=0):
+        """
+        Iterate `(start, stop)` of the spans of `data[pos:]` which are not in
+        quoted fields, every newline in them ends a record. `state` is the
+        state at the end of `data` once the spans are exhausted.
+        """
+        quote = self.quote
+        size = len(data)
+        state = self.state
+        while pos < size:
+            if state == IN_QUOTED_FIELD:
+                q = data.find(quote, pos)
+                if q == -1:
+                    pos = size
+                    break
+                state = QUOTE_IN_QUOTED_FIELD
+                pos = q + 1
+                continue
+            if state == QUOTE_IN_QUOTED_FIELD:
+                if data[pos:pos + 1] == quote:
+                    # a doubled quote
+                    state = IN_QUOTED_FIELD
+                    pos += 1
+                    continue
+                # the quoted field is closed, what follows is unquoted
+                state = IN_FIELD
+            start = pos
+            q = -1 if quote is None else data.find(quote, pos)
+            while q != -1 and not self._at_field_start(data, q, start, state):
+                q = data.find(quote, q + 1)
+            if q == -1:
+                end_state = START_FIELD if self._at_field_start(data, size, start, state) else IN_FIELD
+                yield start, size
+                state = end_state
+                pos = size
+            else:
+                yield start, q
+                state = IN_QUOTED_FIELD
+                pos = q + 1
+        self.state = state
+
+    def ends(self, data, pos=0):
+        """
+        Iterate the offsets after the newlines in `data[pos:]` which end records.
+        """
+        newline = self.newline
+        for start, stop in self.unquoted_spans(data, pos):
+            nl = data.find(newline, start, stop)
+            while nl != -1:
+                yield nl + 1
+                nl = data.find(newline, nl + 1, stop)
+
+    def last_end(self, data, pos=0):
+        """
+        Returns the offset after the last newline in `data[pos:]` which ends
+        a record, or 0 if there's none.
+        """
+        newline = self.newline
+        end = 0
+        for start, stop in self.unquoted_spans(data, pos):
+            nl = data.rfind(newline, start, stop)
+            if nl != -1:
+                end = nl + 1
+        return end
+
+
+class BlockReader(object):
+    """
+    Iterate rows of a binary stream, use `batches` to get rows in lists.
+
+    Records are found by `RecordScanner`, so `escapechar` is not supported.
+    """
+    def __init__(self, stream, encoding='utf-8', reader_kwargs=None, block_size=BLOCK_SIZE):
+        self.reader_kwargs = reader_kwargs or {}
+        if self.reader_kwargs.get('escapechar'):
+            raise ValueError('escapechar is not supported by BlockReader')
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder(encoding or 'utf-8')()
+        self.block_size = block_size
+        if self.reader_kwargs.get('quoting') == csv.QUOTE_NONE:
+            quote = None
+        else:
+            quote = self.reader_kwargs.get('quotechar', '"')
+        self.scanner = RecordScanner(
+            quote, self.reader_kwargs.get('delimiter', ','), '\n',
+            self.reader_kwargs.get('skipinitialspace', False))
+        self._rows = None
+
+    def _read_block(self):
+        # `read1` returns what's available in a pipe, instead of waiting for a full block
+        read = getattr(self.stream, 'read1', self.stream.read)
+        return read(self.block_size)
+
+    def batches(self):
+        pending = ''
+        while True:
+            block = self._read_block()
+            final = not block
+            text = pending + self.decoder.decode(block, final)
+            if final:
+                if text:
+                    yield parse_text(text, self.reader_kwargs)
+                return
+
+            # `pending` has been scanned, only the new text is
+            cut = self.scanner.last_end(text, len(pending))
+            if not cut:
+                pending = text
+                continue
+            pending = text[cut:]
+            rows = parse_text(text[:cut], self.reader_kwargs)
+            if rows:
+                yield rows
+
+    def _iter_rows(self):
+        if self._rows is None:
+            self._rows = itertools.chain.from_iterable(self.batches())
+        return self._rows
+
+    def __iter__(self):
+        # iterating the chain directly saves a method call per row
+        return self._iter_rows()
+
+    def __next__(self):
+        return next(self._iter_rows())
+
+    next = __next__
+
+
+class ThreadedReader(object):
+    """
+    Iterate rows of `reader`, which are read by a background thread into
+    a queue of at most `queue_size` batches of `batch_size` rows, so that
+    waiting on slow input overlaps with rendering and writing. The reader
+    thread blocks when the queue is full.
+
+    Parsing holds the GIL, so this helps when input is slow to arrive,
+    e.g. a pipe or a network filesystem, not when parsing is the bottleneck.
+    """
+    def __init__(self, reader, queue_size=16, batch_size=500):
+        self.queue = queue.Queue(queue_size)
+        self.batch_size = batch_size
+        self.stopped = threading.Event()
+        self._rows = None
+        if hasattr(reader, 'batches'):
+            batches = reader.batches()
+        else:
+            batches = self._batches(iter(reader))
+        self.thread = threading.Thread(target=self._run, args=(batches,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _batches(self, it):
+        while True:
+            batch = list(itertools.islice(it, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, batches):
+        try:
+            for batch in batches:
+                if not self._put(batch):
+                    return
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(None)
+
+    def _get_batches(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _iter_rows(self):
+        if self._rows is None:
+            self._rows = itertools.chain.from_iterable(self._get_batches())
+        return self._rows
+
+    def __iter__(self):
+        return self._iter_rows()
+
+    def __next__(self):
+        return next(self._iter_rows())
+
+    next = __next__
+
+    def close(self):
+        """
+        Stop the reader thread, in case the rows are not read till the end.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+
+def open_input(path, encoding=None):
+    """
+    Returns `(f, encoding, sample)`, `f` is the binary stream of the input,
+    decompressed if it's compressed, see `open_binary`, `sample` is the text
+    of the prefix peeked from `f` without consuming it.
+
+    If `encoding` is None, it's sniffed from the prefix, otherwise the prefix
+    is checked, so that a wrong encoding fails before reading on, raises
+    `ValueError`.
+    """
+    f, _ = open_binary(path)
+    try:
+        prefix = f.peek(SNIFF_SIZE)[:SNIFF_SIZE]
+        if encoding is None:
+            encoding = sniff_encoding(prefix)
+        else:
+            check_encoding(prefix, encoding)
+    except Exception:
+        f.close()
+        raise
+    return f, encoding, decode_prefix(prefix, encoding) or ''
+
+
+def make_reader(f, backend='auto', encoding='utf-8', reader_kwargs=None):
+    """
+    Returns `(f, reader)` of the binary stream `f`, `f` may be wrapped.
+
+    The `auto` backend is `block`, unless `escapechar` is used.
+    """
+    reader_kwargs = reader_kwargs or {}
+    if backend == 'auto':
+        backend = 'stdlib' if reader_kwargs.get('escapechar') else 'block'
+    if backend == 'block':
+        return f, BlockReader(f, encoding, reader_kwargs)
+    # `newline=''` lets csv reader handle the line endings inside quoted fields
+    f = io.TextIOWrapper(f, encoding=encoding, newline='')
+    return f, csv.reader(f, **reader_kwargs)
+
+
+def open_reader(path, backend='auto', encoding=None, reader_kwargs=None):
+    """
+    Returns `(f, reader, encoding)`, `f` should be closed after reading.
+    See `open_input` and `make_reader`.
+    """
+    f, encoding, _ = open_input(path, encoding)
+    f, reader = make_reader(f, backend, encoding, reader_kwargs)
+    return f, reader, encoding
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+
+class BufferedWriter(object):
+    """
+    Collect rendered lines into chunks, each chunk is joined and encoded once,
+    then written to `stream` in one `write` call.
+
+    A chunk is flushed when it reaches `flush_size` characters. If
+    `flush_interval` is set, a timer thread also flushes the chunk when
+    nothing has been flushed for `flush_interval` seconds, so that the pager
+    on the other side of the pipe shows the lines rendered so far while the
+    input stalls, instead of waiting for a full chunk.
+
+    Usage:
+    >>> w = BufferedWriter(sys.stdout.buffer)
+    >>> table.draw(rows, writer=w.write)
+    >>> w.close()
+    """
+    def __init__(self, stream, flush_size=64 * 1024, flush_interval=0.1, encoding='utf-8'):
+        self.stream = stream
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.encoding = encoding
+
+        self.chunk = []
+        self.chunk_size = 0
+        self.last_flush_time = time.time()
+        self.write_count = 0
+        self.flush_count = 0
+
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.thread = None
+        if flush_interval is not None:
+            self.thread = threading.Thread(target=self._flush_idle)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def write(self, s):
+        with self.lock:
+            self.chunk.append(s)
+            self.chunk_size += len(s)
+            self.write_count += 1
+            if self.chunk_size >= self.flush_size:
+                self._flush()
+
+    def _flush_idle(self):
+        while not self.closed.wait(self.flush_interval):
+            with self.lock:
+                if not self.chunk or time.time() - self.last_flush_time < self.flush_interval:
+                    continue
+                try:
+                    self._flush()
+                except (IOError, OSError):
+                    # e.g. the pager has quit, the next flush by `write` raises it again
+                    return
+
+    def _flush(self):
+        self.last_flush_time = time.time()
+        if not self.chunk:
+            return
+        data = ''.join(self.chunk)
+        self.chunk = []
+        self.chunk_size = 0
+        if self.encoding:
+            data = data.encode(self.encoding)
+        self.stream.write(data)
+        self.stream.flush()
+        self.flush_count += 1
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """
+        Stop the timer thread and flush the rest.
+        """
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+What a number looks like in a cell, shared by numeric alignment, `where`
+comparisons, sorting and stats, so that they agree on it.
+"""
+
+import re
+
+
+# thousands separators and a trailing percent sign are allowed, e.g. `1,200` and `12.5%`
+numeric_regex = re.compile(r'^\s*[-+]?(\d[\d,]*(\.\d*)?|\.\d+)([eE][-+]?\d+)?%?\s*$')
+
+
+def to_number(value):
+    """
+    The number of a str matched by `numeric_regex`, or None.
+    """
+    if not numeric_regex.match(value):
+        return None
+    value = value.strip().replace(',', '')
+    if value.endswith('%'):
+        value = value[:-1]
+    return float(value)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Sort rows by a column, in memory or by external merge sort.
+
+Values are compared by type: numbers before dates before strings, empty
+values are the greatest. Rows are sorted in memory until they take more than
+`memory` bytes, then each sorted run is spilled to a temp file, and the
+runs are merged back lazily, so that rows larger than memory can be sorted.
+
+Column widths are measured while the runs are generated, so sorting doesn't
+need another pass over the rows to know their widths.
+"""
+
+import re
+import csv
+import heapq
+import datetime
+import tempfile
+from drawtable.width import text_width
+from drawtable.number import to_number
+
+
+date_regex = re.compile(r'^\s*\d{4}[-/]\d{1,2}[-/]\d{1,2}')
+date_formats = (
+    '%Y-%m-%d', '%Y/%m/%d',
+    '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f',
+)
+
+# rough per row and per cell memory of a list of str in CPython
+ROW_OVERHEAD = 72
+CELL_OVERHEAD = 57
+
+# max number of runs merged at a time, more runs are merged in passes
+MERGE_FAN_IN = 64
+
+
+def _to_date(v):
+    if not date_regex.match(v):
+        return None
+    v = v.strip()
+    for fmt in date_formats:
+        try:
+            return datetime.datetime.strptime(v, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def sort_key(value):
+    """
+    Typed sort key of a value, numbers < dates < strings < empty.
+    """
+    if not value or value.isspace():
+        return (3, '')
+    n = to_number(value)
+    if n is not None:
+        return (0, n)
+    d = _to_date(value)
+    if d is not None:
+        return (1, d)
+    return (2, value)
+
+
+class RowSorter(object):
+    """
+    Usage:
+    >>> sorter = RowSorter(1, desc=True)
+    >>> sorter.extend(rows)
+    >>> sorted_rows = sorter.sorted()
+
+    `cols_width` is updated with the widths of the rows as they are added.
+    """
+    def __init__(self, index, desc=False, memory=256 * 1024 * 1024):
+        self.index = index
+        self.desc = desc
+        self.memory = memory
+        self.rows = []
+        self.rows_bytes = 0
+        self.runs = []
+        self.rowslen = 0
+        self.cols_width = {}
+
+    def key(self, row):
+        return sort_key(row[self.index] if self.index < len(row) else '')
+
+    def append(self, row):
+        size = ROW_OVERHEAD
+        cols_width = self.cols_width
+        for index, i in enumerate(row):
+            size += CELL_OVERHEAD + len(i)
+            i_len = text_width(i)
+            if i_len > cols_width.get(index, -1):
+                cols_width[index] = i_len
+        self.rows.append(row)
+        self.rows_bytes += size
+        self.rowslen += 1
+        if self.rows_bytes > self.memory:
+            self.spill()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def spill(self):
+        """
+        Write the rows in memory to a temp file as a sorted run.
+        """
+        self.rows.sort(key=self.key, reverse=self.desc)
+        self.runs.append(self._write_run(self.rows))
+        self.rows = []
+        self.rows_bytes = 0
+
+    @staticmethod
+    def _write_run(rows):
+        f = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+        csv.writer(f).writerows(rows)
+        f.seek(0)
+        return f
+
+    @staticmethod
+    def _read_run(f):
+        try:
+            for row in csv.reader(f):
+                yield row
+        finally:
+            # temp files are deleted when closed
+            f.close()
+
+    def _merge(self, runs):
+        return heapq.merge(*[self._read_run(f) for f in runs], key=self.key, reverse=self.desc)
+
+    def sorted(self):
+        """
+        Returns an iterator of the sorted rows, the sort is stable.
+        """
+        if not self.runs:
+            self.rows.sort(key=self.key, reverse=self.desc)
+            return iter(self.rows)
+        if self.rows:
+            self.spill()
+        runs = self.runs
+        self.runs = []
+        while len(runs) > MERGE_FAN_IN:
+            runs = [self._write_run(self._merge(runs[:MERGE_FAN_IN]))] + runs[MERGE_FAN_IN:]
+        return self._merge(runs)
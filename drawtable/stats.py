@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Column statistics collected in a single pass over the rows, in constant memory.
+
+For each column: the number of values and of nulls (empty or missing values),
+min/max by the typed order of `sort_key`, the distinct count, and sum/mean
+if all the values are numbers. Distinct values are counted exactly until
+there are `DistinctCounter.exact_limit` of them, then estimated by HyperLogLog.
+"""
+
+import math
+from drawtable.sort import sort_key
+
+
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct values with `2 ** p` one byte registers,
+    the standard error is about `1.04 / sqrt(2 ** p)`, 1.6% for the default p.
+
+    Values are hashed by `hash()`, estimates may differ slightly between
+    processes as str hashes are randomized.
+    """
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self.rest_bits = 64 - p
+        self.rest_mask = (1 << self.rest_bits) - 1
+
+    def add(self, value):
+        x = hash(value) & 0xFFFFFFFFFFFFFFFF
+        index = x >> self.rest_bits
+        # position of the leftmost 1 bit in the rest bits
+        rank = self.rest_bits - (x & self.rest_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting for small cardinalities
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+
+class DistinctCounter(object):
+    exact_limit = 1024
+
+    def __init__(self):
+        self.values = set()
+        self.hll = None
+
+    @property
+    def exact(self):
+        return self.hll is None
+
+    def add(self, value):
+        if self.hll is not None:
+            self.hll.add(value)
+            return
+        self.values.add(value)
+        if len(self.values) > self.exact_limit:
+            self.hll = HyperLogLog()
+            for i in self.values:
+                self.hll.add(i)
+            self.values = None
+
+    def count(self):
+        if self.hll is None:
+            return len(self.values)
+        return self.hll.count()
+
+
+class ColumnStats(object):
+    def __init__(self, nulls=0):
+        self.count = 0
+        self.nulls = nulls
+        self.distinct = DistinctCounter()
+        self.min_key = self.min = None
+        self.max_key = self.max = None
+        self.numbers = 0
+        self.sum = 0.0
+
+    def update(self, value):
+        if not value or value.isspace():
+            self.nulls += 1
+            return
+        self.count += 1
+        self.distinct.add(value)
+        key = sort_key(value)
+        if self.min_key is None or key < self.min_key:
+            self.min_key, self.min = key, value
+        if self.max_key is None or key > self.max_key:
+            self.max_key, self.max = key, value
+        if key[0] == 0:
+            self.numbers += 1
+            self.sum += key[1]
+
+    @property
+    def is_numeric(self):
+        return self.count > 0 and self.numbers == self.count
+
+    @property
+    def mean(self):
+        if not self.is_numeric:
+            return None
+        return self.sum / self.count
+
+    def values(self):
+        """
+        Returns a list of `(name, value)`, values are formatted str.
+        """
+        distinct = str(self.distinct.count())
+        if not self.distinct.exact:
+            distinct = '~' + distinct
+        values = [
+            ('count', str(self.count)),
+            ('nulls', str(self.nulls)),
+            ('distinct', distinct),
+            ('min', self.min or ''),
+            ('max', self.max or ''),
+        ]
+        if self.is_numeric:
+            values.append(('sum', format_number(self.sum)))
+            values.append(('mean', format_number(self.mean)))
+        else:
+            values.append(('sum', ''))
+            values.append(('mean', ''))
+        return values
+
+
+def format_number(n):
+    if math.isinf(n):
+        return str(n)
+    if n == int(n) and abs(n) < 1e15:
+        return str(int(n))
+    return '{:.6g}'.format(n)
+
+
+class TableStats(object):
+    """
+    Usage:
+    >>> stats = TableStats()
+    >>> for row in stats.observe(rows):
+    ...     render(row)
+    >>> stats.footer_row()
+
+    `observe` updates the stats as rows are read, so that they are
+    collected by whatever pass reads the rows, without another pass.
+    """
+    # names of the stats, in the order of the columns of `summary_rows`
+    names = ('count', 'nulls', 'distinct', 'min', 'max', 'sum', 'mean')
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = []
+
+    def update(self, row):
+        columns = self.columns
+        while len(columns) < len(row):
+            # the rows before have no value in the column
+            columns.append(ColumnStats(nulls=self.rows))
+        self.rows += 1
+        for column, value in zip(columns, row):
+            column.update(value)
+        for column in columns[len(row):]:
+            column.nulls += 1
+
+    def observe(self, rows):
+        for row in rows:
+            self.update(row)
+            yield row
+
+    def footer_row(self):
+        """
+        A row of the stats of each column, one stat per line,
+        sum and mean are left out for columns which are not numeric.
+        """
+        row = []
+        for column in self.columns:
+            lines = ['{}: {}'.format(name, value.replace('\n', ' ')) for name, value in column.values()
+                     if value or name not in ('sum', 'mean')]
+            row.append('\n'.join(lines))
+        return row
+
+    def summary_rows(self, header=None):
+        """
+        A table of the stats, with a row for each column.
+        """
+        header = header or []
+        rows = [['column'] + list(self.names)]
+        for index, column in enumerate(self.columns):
+            name = header[index] if index < len(header) else '#{}'.format(index + 1)
+            rows.append([name] + [value for _, value in column.values()])
+        return rows
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Compact columnar storage of rows for the buffered draw path.
+
+Each column is one contiguous UTF-8 `bytearray` with a byte length per cell,
+instead of a `str` object per cell and a `list` per row, so that holding all
+the rows costs about the size of the data. Rows are appended and decoded in
+batches, and only decoded back into lists when they are iterated for rendering.
+"""
+
+import sys
+import itertools
+from array import array
+from drawtable.width import is_plain, text_width
+
+PY2 = sys.version_info.major == 2
+
+if PY2:
+    from itertools import izip_longest as zip_longest
+
+    def accumulate(values):
+        total = 0
+        for i in values:
+            total += i
+            yield total
+else:
+    from itertools import zip_longest, accumulate
+
+
+# str may hold lone surrogates, e.g. from `surrogateescape`, keep them as they are,
+# Python 2 encodes them with utf-8 by default
+UTF8_ERRORS = 'strict' if PY2 else 'surrogatepass'
+
+# a cell length of `LONG_LENGTH` means the real length is in `long_lengths`
+LONG_LENGTH = 255
+
+
+class Column(object):
+    __slots__ = ('data', 'lengths', 'long_lengths', 'width')
+
+    def __init__(self, rows_num=0):
+        self.data = bytearray()
+        # byte length of each cell, rows before the column appears are empty
+        self.lengths = array('B', bytearray(rows_num))
+        self.long_lengths = array('Q')
+        # max width of the cells
+        self.width = 0
+
+    def extend(self, values):
+        joined = ''.join(values)
+        encoded = joined.encode('utf-8', UTF8_ERRORS)
+        self.data += encoded
+        if len(encoded) == len(joined):
+            lengths = list(map(len, values))
+            if is_plain(joined):
+                width = max(lengths) if lengths else 0
+            else:
+                width = max(map(text_width, values))
+        else:
+            lengths = [len(i.encode('utf-8', UTF8_ERRORS)) for i in values]
+            width = max(map(text_width, values))
+        if width > self.width:
+            self.width = width
+
+        if max(lengths) < LONG_LENGTH:
+            self.lengths.extend(lengths)
+            return
+        for length in lengths:
+            if length >= LONG_LENGTH:
+                self.lengths.append(LONG_LENGTH)
+                self.long_lengths.append(length)
+            else:
+                self.lengths.append(length)
+
+    def chunks(self, size):
+        """
+        Yield the values of the column in lists of `size` cells.
+        """
+        pos = 0
+        long_lengths = iter(self.long_lengths)
+        for start in range(0, len(self.lengths), size):
+            lengths = self.lengths[start:start + size].tolist()
+            if LONG_LENGTH in lengths:
+                lengths = [next(long_lengths) if i == LONG_LENGTH else i for i in lengths]
+            total = sum(lengths)
+            chunk = self.data[pos:pos + total]
+            pos += total
+            text = chunk.decode('utf-8', UTF8_ERRORS)
+            ends = accumulate(lengths)
+            if len(text) == total:
+                # ASCII, byte offsets are char offsets
+                yield [text[end - length:end] for end, length in zip(ends, lengths)]
+            else:
+                yield [chunk[end - length:end].decode('utf-8', UTF8_ERRORS) for end, length in zip(ends, lengths)]
+
+    def nbytes(self):
+        return len(self.data) + len(self.lengths) + len(self.long_lengths) * self.long_lengths.itemsize
+
+
+class ColumnStore(object):
+    """
+    Usage:
+    >>> store = ColumnStore()
+    >>> store.append(['a', 'bb'])
+    >>> store.cols_width()
+    {0: 1, 1: 2}
+    >>> list(store)
+    [['a', 'bb']]
+
+    Rows keep their lengths, a row shorter than the others is iterated as is.
+    """
+    # number of rows appended or decoded at a time
+    batch_size = 1024
+
+    def __init__(self):
+        self.columns = []
+        # number of cells of each row
+        self.lengths = array('I')
+        self.pending = []
+
+    def __len__(self):
+        return len(self.lengths) + len(self.pending)
+
+    def append(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def flush(self):
+        rows = self.pending
+        if not rows:
+            return
+        self.pending = []
+        columns = self.columns
+        lengths = list(map(len, rows))
+        while len(columns) < max(lengths):
+            columns.append(Column(len(self.lengths)))
+        self.lengths.extend(lengths)
+        values_list = list(zip_longest(*rows, fillvalue=''))
+        for column, values in zip(columns, values_list):
+            column.extend(values)
+        for column in columns[len(values_list):]:
+            column.extend([''] * len(rows))
+
+    def __iter__(self):
+        self.flush()
+        size = self.batch_size
+        if not self.columns:
+            for _ in self.lengths:
+                yield []
+            return
+        cols_num = len(self.columns)
+        chunks = [column.chunks(size) for column in self.columns]
+        for start in range(0, len(self.lengths), size):
+            rows = zip(*[next(i) for i in chunks])
+            lengths = self.lengths[start:start + size]
+            if min(lengths) == cols_num:
+                for row in rows:
+                    yield list(row)
+            else:
+                for row, length in zip(rows, lengths):
+                    yield list(row[:length])
+
+    def __getitem__(self, index):
+        """
+        Only slices are supported, rows are decoded from the start.
+        """
+        if not isinstance(index, slice):
+            raise TypeError('ColumnStore only supports slicing')
+        return list(itertools.islice(self, *index.indices(len(self))))
+
+    def cols_width(self):
+        """
+        Max width of each column, the same as `update_cols_width` on all the rows.
+        """
+        self.flush()
+        return dict((index, column.width) for index, column in enumerate(self.columns))
+
+    def nbytes(self):
+        self.flush()
+        return sum(column.nbytes() for column in self.columns) + \
+            len(self.lengths) * self.lengths.itemsize
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Display width calculation for table cells.
+
+`wcswidth` looks up the unicode tables for every character, which is slow
+when called for every cell, while the values in a column usually repeat a lot.
+Widths of non-ASCII strings are memoized in a bounded LRU cache, and
+printable ASCII strings skip the lookup since their width equals their length.
+"""
+
+from wcwidth import wcwidth, wcswidth
+
+try:
+    from functools import lru_cache
+except ImportError:
+    # python 2
+    lru_cache = None
+
+
+DEFAULT_CACHE_SIZE = 65536
+
+
+def _make_cached_wcswidth(maxsize):
+    if lru_cache is None:
+        return wcswidth
+    return lru_cache(maxsize=maxsize)(wcswidth)
+
+
+_cached_wcswidth = _make_cached_wcswidth(DEFAULT_CACHE_SIZE)
+
+
+if hasattr(str, 'isascii'):
+    def is_ascii(s):
+        return s.isascii()
+
+    def is_plain(s):
+        """
+        Whether `s` only contains printable ASCII characters, whose display
+        width equals the length.
+        """
+        return s.isascii() and s.isprintable()
+
+    def str_width(s):
+        """
+        Same as `wcswidth`, returns -1 if `s` contains non-printable characters.
+        """
+        if s.isascii() and s.isprintable():
+            return len(s)
+        return _cached_wcswidth(s)
+else:
+    def is_ascii(s):
+        try:
+            s.encode('ascii')
+        except UnicodeError:
+            return False
+        return True
+
+    def is_plain(s):
+        return False
+
+    def str_width(s):
+        return _cached_wcswidth(s)
+
+
+def _char_width(c):
+    w = wcwidth(c)
+    if w < 0:
+        return 1
+    return w
+
+
+if lru_cache is not None:
+    _char_width = lru_cache(maxsize=4096)(_char_width)
+
+
+def char_width(c):
+    """
+    Width of a single character, non-printable characters are counted as one.
+    """
+    return _char_width(c)
+
+
+def text_width(s):
+    """
+    Width of the widest line in `s`, non-printable characters other than
+    newline are counted as one column each.
+    """
+    if '\n' in s:
+        return max(text_width(i) for i in s.split('\n'))
+    w = str_width(s)
+    if w < 0:
+        return sum(char_width(c) for c in s)
+    return w
+
+
+def wrap_str(s, width, word_wrap=False):
+    """
+    Split a single line `s` into pieces of at most `width` display width,
+    returns a list of `(piece, piece_width)`, so that the pieces don't need
+    to be measured again when padding.
+
+    Characters are walked once, cutting at the character which makes the
+    cumulative width exceed `width`. If `word_wrap` is true, cut after the
+    last space in the piece when there is one.
+    """
+    total = str_width(s)
+    if 0 <= total <= width:
+        return [(s, total)]
+    if width <= 0:
+        return [(s, text_width(s))]
+    if total >= 0 and not word_wrap and is_ascii(s):
+        # every character is one column wide
+        return [(s[i:i + width], min(width, total - i)) for i in range(0, total, width)]
+
+    pieces = []
+    start = 0
+    cur = 0
+    space = -1
+    space_w = 0
+    for index, c in enumerate(s):
+        w = char_width(c)
+        while cur + w > width and index > start:
+            if space > start:
+                pieces.append((s[start:space], space_w))
+                start = space
+                cur -= space_w
+            else:
+                pieces.append((s[start:index], cur))
+                start = index
+                cur = 0
+            space = -1
+        cur += w
+        if word_wrap and c == ' ':
+            space = index + 1
+            space_w = cur
+    pieces.append((s[start:], cur))
+    return pieces
+
+
+def slice_str(s, start, width):
+    """
+    Returns the part of `s` in display columns `[start, start + width)`,
+    a wide character cut by either edge is replaced by spaces.
+    """
+    if is_ascii(s):
+        return s[start:start + width]
+    end = start + width
+    pieces = []
+    col = 0
+    for c in s:
+        if col >= end:
+            break
+        w = char_width(c)
+        next_col = col + w
+        if col >= start and next_col <= end:
+            pieces.append(c)
+        elif next_col > start:
+            # partially visible
+            pieces.append(' ' * (min(next_col, end) - max(col, start)))
+        col = next_col
+    return ''.join(pieces)
+
+
+def set_cache_size(maxsize):
+    global _cached_wcswidth
+    _cached_wcswidth = _make_cached_wcswidth(maxsize)
+
+
+def clear_cache():
+    if lru_cache is not None:
+        _cached_wcswidth.cache_clear()
+
+
+def cache_info():
+    """
+    Returns a dict of `hits`, `misses`, `maxsize`, `currsize` of the cache,
+    ASCII strings are not counted since they don't go through the cache.
+    """
+    if lru_cache is None:
+        return {'hits': 0, 'misses': 0, 'maxsize': 0, 'currsize': 0}
+    ci = _cached_wcswidth.cache_info()
+    return {
+        'hits': ci.hits,
+        'misses': ci.misses,
+        'maxsize': ci.maxsize,
+        'currsize': ci.currsize,
+    }
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of reading rows in the main thread and in a background thread,
+on input which is slow to arrive, like a pipe or a network filesystem.
+
+Usage: PYTHONPATH=. python scripts/bench_pipeline.py [FILE ...]
+"""
+
+import io
+import csv
+import sys
+import time
+from drawtable import Table
+from drawtable.csvless.readers import ThreadedReader
+
+
+def slow_rows(rows, delay, batch_size=500):
+    # sleeping releases the GIL, like waiting on I/O
+    for i, row in enumerate(rows):
+        if i % batch_size == 0:
+            time.sleep(delay)
+        yield row
+
+
+def bench(rows, delay, read_ahead):
+    tb = Table(max_col_width=32, table_style='box', stream=True)
+    reader = slow_rows(rows, delay)
+    if read_ahead:
+        reader = ThreadedReader(reader, read_ahead)
+    start = time.time()
+    tb.draw(reader, writer=lambda s: None)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    files = sys.argv[1:] or ['samples/ilgeo2010_excerpt.csv', 'samples/utf8.csv']
+    for path in files:
+        with io.open(path, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        rows = rows[:1] + rows[1:] * max(1, 20000 // max(1, len(rows) - 1))
+        # make the input about as slow as rendering
+        render_time = bench(rows, 0, 0)
+        delay = render_time / (len(rows) / 500.0)
+        serial = bench(rows, delay, 0)
+        threaded = bench(rows, delay, 16)
+        print('{}: render only {:.2f}s, slow input {:.2f}s in main thread, {:.2f}s with read ahead'.format(
+            path, render_time, serial, threaded))
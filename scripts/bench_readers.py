@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the csvless reader backends, prints rows/sec for each sample CSV file.
+
+Usage: PYTHONPATH=. python scripts/bench_readers.py [FILE ...]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from drawtable.csvless.readers import open_reader
+
+
+def bench(path, backend, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        f, reader, _ = open_reader(path, backend)
+        rowslen = sum(1 for _ in reader)
+        f.close()
+        t = time.time() - start
+        if best is None or t < best:
+            best = t
+    return rowslen / best
+
+
+if __name__ == '__main__':
+    files = sys.argv[1:] or ['samples/ilgeo2010_excerpt.csv', 'samples/utf8.csv']
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for path in files:
+            # make small samples big enough to time
+            big_path = os.path.join(tmpdir, os.path.basename(path))
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(big_path, 'wb') as f:
+                for _ in range(max(1, 20 * 1024 * 1024 // max(1, len(data)))):
+                    f.write(data)
+            print('{}: {:10.0f} rows/s stdlib, {:10.0f} rows/s block'.format(
+                path, bench(big_path, 'stdlib'), bench(big_path, 'block')))
+    finally:
+        shutil.rmtree(tmpdir)
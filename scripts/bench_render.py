@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of rendering rows with and without the compiled row template,
+prints rows/sec for each sample CSV file.
+
+Usage: PYTHONPATH=. python scripts/bench_render.py [FILE ...]
+"""
+
+import io
+import csv
+import sys
+import time
+from drawtable import Table
+
+
+def bench(rows, use_row_template, wrap_row, repeat=5):
+    tb = Table(max_col_width=32, table_style='box', wrap_row=wrap_row)
+    tb.use_row_template = use_row_template
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        tb.draw(rows, writer=lambda s: None)
+        t = time.time() - start
+        if best is None or t < best:
+            best = t
+    return (len(rows) - 1) / best
+
+
+if __name__ == '__main__':
+    files = sys.argv[1:] or ['samples/ilgeo2010_excerpt.csv', 'samples/utf8.csv']
+    for path in files:
+        with io.open(path, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        # make small samples big enough to time
+        rows = rows[:1] + rows[1:] * max(1, 20000 // max(1, len(rows) - 1))
+        for wrap_row in (True, False):
+            before = bench(rows, False, wrap_row)
+            after = bench(rows, True, wrap_row)
+            print('{} wrap_row={}: {:10.0f} rows/s without template, {:10.0f} rows/s with template'.format(
+                path, wrap_row, before, after))
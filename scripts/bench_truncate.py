@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of `truncate_str` on wide characters, with the width cache
+disabled, the time per call should grow linearly with the cell length.
+
+Usage: PYTHONPATH=. python scripts/bench_truncate.py
+"""
+
+import timeit
+
+
+setup = '''
+from drawtable import truncate_str, width
+width.set_cache_size(0)
+s = u'中文字符' * {n}
+'''
+
+
+if __name__ == '__main__':
+    number = 1000
+    for length in [16, 64, 256, 1024, 4096]:
+        # truncate to half of the display width
+        t = timeit.timeit('truncate_str(s, {})'.format(length), setup=setup.format(n=length // 4), number=number)
+        print('length {:>5}: {:8.2f}us per call'.format(length, t / number * 1e6))
@@ -28,6 +28,15 @@ def datadir():
     return datadir()
 
 
+@pytest.fixture(autouse=True)
+def csvless_env(tmpdir, monkeypatch):
+    """
+    Keep csvless off the user's cache and config, the subprocesses inherit the env.
+    """
+    monkeypatch.setenv('CSVLESS_CACHE_DIR', str(tmpdir.join('cache')))
+    monkeypatch.setenv('CSVLESS_CONFIG', str(tmpdir.join('config.json')))
+
+
 def do_csvless(filepath, extra_args=None, with_coverage=True):
     """
     :return: stdout
@@ -83,3 +92,506 @@ def test_csvless_cat(datadir):
     test if `--cat` makes any difference
     """
     assert do_csvless(datadir.path('generic.csv'), ['--cat', '-s', 'markdown', '-n']) == datadir.content('generic_s_markdown_n.txt')
+
+
+def test_csvless_stream(datadir):
+    assert do_csvless(datadir.path('generic.csv'), ['--stream', '-s', 'box', '-n']) == datadir.content('generic_s_box_n.txt')
+
+
+def test_buffered_writer():
+    import io
+    from drawtable.csvless.writer import BufferedWriter
+
+    stream = io.BytesIO()
+    w = BufferedWriter(stream, flush_size=8, flush_interval=None)
+    w.write(u'中文\n')
+    w.write(u'abc\n')
+    assert w.flush_count == 0
+    w.write(u'defg\n')
+    assert w.flush_count == 1
+    w.write(u'h\n')
+    w.flush()
+    assert w.flush_count == 2
+    assert stream.getvalue().decode('utf-8') == u'中文\nabc\ndefg\nh\n'
+
+
+def test_buffered_writer_idle():
+    import io
+    import time
+    from drawtable.csvless.writer import BufferedWriter
+
+    stream = io.BytesIO()
+    w = BufferedWriter(stream, flush_interval=0.05)
+    w.write(u'header\n')
+    # no more writes, e.g. the input stalls
+    for _ in range(100):
+        if w.flush_count:
+            break
+        time.sleep(0.01)
+    assert stream.getvalue() == b'header\n'
+    w.write(u'row\n')
+    w.close()
+    assert not w.thread.is_alive()
+    assert stream.getvalue() == b'header\nrow\n'
+
+
+def test_csvless_jobs(datadir):
+    assert do_csvless(datadir.path('generic.csv'), ['--cat', '-j', '2', '-s', 'box', '-n']) == datadir.content('generic_s_box_n.txt')
+
+
+def test_prescan(tmpdir):
+    import csv
+    from drawtable.csvless.prescan import split_ranges, prescan_cols_width
+
+    path = str(tmpdir.join('prescan.csv'))
+    rows = [['h1', 'h2']] + [['x' * (i % 7), 'a\n"b"\nc' * (i % 3)] for i in range(200)]
+    with open(path, 'w') as f:
+        csv.writer(f).writerows(rows)
+
+    ranges = split_ranges(path, 4)
+    assert len(ranges) == 4
+    with open(path, 'rb') as f:
+        data = f.read()
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        # ranges start at lines, some are inside quoted fields
+        assert end == start
+        assert data[start - 1:start] == b'\n'
+
+    cols_width, rowslen = prescan_cols_width(path, 4)
+    assert rowslen == 200
+    assert cols_width == {0: 6, 1: 3}
+
+
+def test_prescan_stray_quote(tmpdir):
+    import csv
+    from drawtable import update_cols_width
+    from drawtable.csvless.prescan import prescan_cols_width
+
+    path = tmpdir.join('stray.csv')
+    path.write('name,size,x\n5" screen,10,y\n' + ('a,"b\n' + 'c' * 48 + '",z\n') * 3000)
+    with open(str(path), newline='') as f:
+        rows = list(csv.reader(f))
+    cols_width = {}
+    for row in rows[1:]:
+        update_cols_width(cols_width, row)
+
+    assert prescan_cols_width(str(path), 4) == (cols_width, len(rows) - 1)
+
+
+def test_prescan_skipinitialspace(tmpdir):
+    from drawtable.csvless.prescan import prescan_cols_width
+
+    path = tmpdir.join('space.csv')
+    path.write('id, text\n' + ''.join('{}, "x\n{}"\n'.format(i, 'y' * (i % 9)) for i in range(500)))
+    assert prescan_cols_width(str(path), 4, reader_kwargs={'skipinitialspace': True}) == ({0: 3, 1: 8}, 500)
+
+
+def test_width_cache(tmpdir):
+    from drawtable.csvless.cache import WidthCache
+
+    path = str(tmpdir.join('a.csv'))
+    with open(path, 'w') as f:
+        f.write('a,b\n1,2\n')
+
+    cache = WidthCache(str(tmpdir.join('cache')), max_size=100)
+    key = cache.key(path, delimiter=',')
+    assert key != cache.key(path, delimiter=';')
+    assert cache.key(str(tmpdir.join('missing.csv'))) is None
+    assert cache.get(key) is None
+
+    cache.set(key, {0: 1, 1: 1}, 1)
+    assert cache.get(key) == ({0: 1, 1: 1}, 1)
+
+    # evicted when the cache dir is over max_size
+    for i in range(10):
+        cache.set('k{}'.format(i), {0: i}, i)
+    assert cache.get(key) is None
+    assert cache.get('k9') == ({0: 9}, 9)
+
+
+def test_row_index(tmpdir, monkeypatch):
+    import csv
+    from drawtable.csvless import index as index_module
+    from drawtable.csvless.index import RowIndex
+
+    monkeypatch.setattr(index_module, 'BLOCK_SIZE', 64)
+    path = str(tmpdir.join('index.csv'))
+    rows = [['h1', 'h2']] + [[str(i), 'a\n"b"\n' * (i % 3)] for i in range(3000)]
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+    index = RowIndex(path)
+    index.build(until_row=10)
+    assert not index.complete
+    assert index.read_rows(5, 7) == rows[5:7]
+    assert index.read_rows(2000, 2002) == rows[2000:2002]
+    index.build()
+    assert index.complete
+    assert len(index) == len(rows)
+    assert index.save()
+
+    loaded = RowIndex.load_or_create(path)
+    assert loaded.complete
+    assert list(loaded.offsets) == list(index.offsets)
+    assert list(loaded.iter_rows(2990, batch_size=4)) == rows[2990:]
+
+
+def test_row_index_stray_quote(tmpdir, monkeypatch):
+    import csv
+    from drawtable.csvless import index as index_module
+    from drawtable.csvless.index import RowIndex
+
+    monkeypatch.setattr(index_module, 'BLOCK_SIZE', 64)
+    path = tmpdir.join('stray.csv')
+    path.write('name,size,x\n5" screen,10,y\n' + 'a,"b\nc",z\n' * 3000)
+    with open(str(path), newline='') as f:
+        rows = list(csv.reader(f))
+
+    index = RowIndex(str(path))
+    index.build()
+    assert len(index) == len(rows)
+    assert index.read_rows(100, 102) == rows[100:102]
+    out = do_csvless(str(path), ['--cat', '-s', 'base', '--no-cache', '--from-row', '3000', '--head', '1'])
+    assert out.splitlines()[1:] == [' a     b     z ', '       c       ']
+
+
+def test_row_index_skipinitialspace(tmpdir):
+    from drawtable.csvless.index import RowIndex
+
+    path = tmpdir.join('space.csv')
+    path.write('id, text\n' + ''.join('{}, "x\n{}"\n'.format(i, i) for i in range(10)))
+    reader_kwargs = {'skipinitialspace': True}
+    index = RowIndex(str(path), skipinitialspace=True)
+    assert index.read_rows(3, 4, reader_kwargs=reader_kwargs) == [['2', 'x\n2']]
+    assert index.save()
+    # an index built without skipinitialspace is not reused
+    assert not RowIndex.load_or_create(str(path)).scanned
+    assert RowIndex.load_or_create(str(path), skipinitialspace=True).complete
+
+
+def test_tail_offset(tmpdir, monkeypatch):
+    from drawtable.csvless import index as index_module
+    from drawtable.csvless.index import tail_offset
+
+    monkeypatch.setattr(index_module, 'BLOCK_SIZE', 4)
+    path = tmpdir.join('tail.csv')
+    path.write('h\n1\n22\n333\n')
+    assert tail_offset(str(path), 2) == 4
+    assert tail_offset(str(path), 3) == 2
+    assert tail_offset(str(path), 4) is None
+    path.write('h\n1\n"2\n2"\n333')
+    assert tail_offset(str(path), 1) == 10
+    assert tail_offset(str(path), 2) is None
+
+
+def test_csvless_from_row(datadir, tmpdir):
+    import shutil
+    path = str(tmpdir.join('generic.csv'))
+    shutil.copy(datadir.path('generic.csv'), path)
+    out = do_csvless(path, ['--cat', '-s', 'base', '-n', '--from-row', '2'])
+    assert out.splitlines() == [
+        '         foo  long head 12     bar ',
+        '              345                  ',
+        '      2       a very very   2      ',
+        '              long cell            ',
+    ]
+
+
+def test_pager(tmpdir):
+    import csv
+    from drawtable import Table
+    from drawtable.csvless.index import RowIndex
+    from drawtable.csvless.pager import Pager, IndexRowSource, StreamRowSource
+
+    path = str(tmpdir.join('pager.csv'))
+    rows = [['id', 'name']] + [[str(i), u'名字{}'.format(i)] for i in range(500)]
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+    sources = [
+        IndexRowSource(RowIndex(path), first_record=1),
+        StreamRowSource(iter(rows[1:])),
+    ]
+    for source in sources:
+        pager = Pager(Table(table_style='box', max_col_width=10), source, rows[0])
+        pager.batch_size = 10
+        assert pager.screen_lines(6, 80) == [
+            u'┌─────┬─────────┐',
+            u'│ id  │ name    │',
+            u'├─────┼─────────┤',
+            u'│ 0   │ 名字0   │',
+            u'├─────┼─────────┤',
+            u'│ 1   │ 名字1   │',
+        ]
+        pager.scroll(250)
+        assert pager.screen_lines(5, 10)[-1] == u'│ 250 │ 名'
+        # wide char cut by the left edge
+        pager.left = 9
+        assert pager.screen_lines(5, 80)[-1] == u' 字250 │'
+        pager.left = 0
+        pager.scroll(1000)
+        assert pager.top == 499
+        assert pager.screen_lines(6, 80)[-2:] == [u'│ 499 │ 名字499 │', u'└─────┴─────────┘']
+
+
+def test_pager_window():
+    from drawtable import Table
+    from drawtable.width import slice_str
+    from drawtable.csvless.pager import Pager, StreamRowSource
+
+    header = ['c{}'.format(i) for i in range(20)]
+    rows = [[u'名字{}'.format(i * j) for j in range(20)] for i in range(30)]
+    for style, row_numbers in (('box', True), ('base', False)):
+        full = Pager(Table(table_style=style, row_numbers=row_numbers), StreamRowSource(rows), header)
+        full_lines = full.screen_lines(10, 1000)
+        pager = Pager(Table(table_style=style, row_numbers=row_numbers), StreamRowSource(rows), header)
+        for left in range(0, 120, 7):
+            pager.left = left
+            assert pager.screen_lines(10, 15) == [slice_str(i, left, 15) for i in full_lines]
+            # only the columns on the screen are rendered
+            assert len(pager.table.visible_cols) <= 3
+
+
+def test_stream_row_source():
+    from drawtable.csvless.pager import StreamRowSource
+
+    rows = [[str(i), 'a\nb' * (i % 2)] for i in range(1000)] + [[], ['']]
+    source = StreamRowSource(iter(rows))
+    source.window_size = 50
+    source.block_size = 20
+    assert source.get_rows(0, 10) == rows[:10]
+    assert source.get_rows(500, 530) == rows[500:530]
+    assert len(source.window) <= 70
+    # scroll back into the spilled rows, across blocks
+    assert source.get_rows(5, 65) == rows[5:65]
+    assert source.count() == len(rows)
+    assert len(source.window) <= 70
+    assert source.get_rows(990, 2000) == rows[990:]
+    assert source.get_rows(0, 1002) == rows
+
+
+def test_config_profile(datadir, tmpdir):
+    import json
+    config = str(tmpdir.join('config.json'))
+    with open(config, 'w') as f:
+        json.dump({'profiles': [
+            {'pattern': 'other*.csv', 'columns': {'foo': {'hidden': True}}},
+            {'pattern': 'gener*.csv', 'columns': {'foo': {'fixed': 5, 'align': 'right'}, '#3': {'hidden': True}}},
+        ]}, f)
+    out = do_csvless(datadir.path('generic.csv'), ['--cat', '-s', 'base', '--config', config])
+    assert out.splitlines() == [
+        '   foo  long head 12  bar   ',
+        '        345                 ',
+        '     1  f             b a r ',
+        '        o                   ',
+        '        o                   ',
+        '        a very very         ',
+        '        long cell           ',
+    ]
+
+
+def test_csvless_columns_where(datadir):
+    out = do_csvless(datadir.path('generic.csv'), ['--cat', '-s', 'base', '--no-cache', '-c', 'bar,#1', '--where', '#2 ~ f'])
+    assert out.splitlines() == [
+        ' bar    foo ',
+        ' b a r  1   ',
+    ]
+
+
+@pytest.mark.parametrize('extra_args, message', [
+    (['-c', 'nosuch'], b"unknown column: 'nosuch', columns are foo, long head 12345, , bar"),
+    (['--where', 'nosuch = 1'], b"unknown column: 'nosuch'"),
+    (['--where', 'foo'], b"invalid --where: 'foo'"),
+    (['--sort', 'nosuch:desc'], b"unknown column: 'nosuch'"),
+])
+def test_csvless_bad_columns(datadir, extra_args, message):
+    p = subprocess.Popen(['python', '-m', 'drawtable.csvless', '--cat'] + extra_args + [datadir.path('generic.csv')],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    assert p.returncode == 2
+    assert message in err
+    assert b'Traceback' not in err
+
+
+def test_csvless_head_tail(datadir, tmpdir):
+    path = tmpdir.join('limit.csv')
+    path.write('id\n' + ''.join('{}\n'.format(i) for i in range(10)))
+    assert do_csvless(str(path), ['--cat', '-s', 'base', '--head', '2']).splitlines() == [
+        ' id ', ' 0  ', ' 1  ']
+    assert do_csvless(str(path), ['--cat', '-s', 'base', '--tail', '2']).splitlines() == [
+        ' id ', ' 8  ', ' 9  ']
+
+
+@pytest.mark.parametrize('reader_kwargs', [{}, {'delimiter': '\t'}, {'quoting': 3}, {'skipinitialspace': True}])
+def test_block_reader(reader_kwargs):
+    import io
+    import csv
+    from drawtable.csvless.readers import BlockReader
+
+    text = u'a,b\tc\r\n\n"x\n""y""",  z\r\n1,"2\r\n3"\n中文, e\n' * 20 + u'no,newline'
+    expected = list(csv.reader(io.StringIO(text, newline=''), **reader_kwargs))
+    for block_size in (1, 5, 1024):
+        reader = BlockReader(io.BytesIO(text.encode('utf-8')), 'utf-8', reader_kwargs, block_size)
+        assert list(reader) == expected
+
+
+def test_block_reader_stray_quote():
+    import io
+    import csv
+    from drawtable.csvless.readers import BlockReader
+
+    # the quote is not at the start of the field, it's a literal char
+    text = u'name,size\n5" screen,10\n' + u'"a\nb",1\n' * 1000
+    expected = list(csv.reader(io.StringIO(text, newline='')))
+    reader = BlockReader(io.BytesIO(text.encode('utf-8')), 'utf-8', {}, 1024)
+    batches = list(reader.batches())
+    assert len(batches) > 1
+    assert [row for batch in batches for row in batch] == expected
+
+
+@pytest.mark.parametrize('ext, module', [('gz', 'gzip'), ('bz2', 'bz2'), ('xz', 'lzma')])
+def test_compressed_input(datadir, tmpdir, ext, module):
+    import importlib
+    from drawtable.csvless import compress
+
+    with open(datadir.path('generic.csv'), 'rb') as f:
+        data = f.read()
+    path = str(tmpdir.join('generic.csv.' + ext))
+    with importlib.import_module(module).open(path, 'wb') as f:
+        f.write(data * 3)
+    assert compress.is_compressed(path)
+
+    import io
+    raw = compress.ThreadedDecompressor(ext.replace('gz', 'gzip'), io.open(path, 'rb'), block_size=7, queue_size=2)
+    f = io.BufferedReader(raw, 5)
+    assert f.read() == data * 3
+    f.close()
+
+    expected = do_csvless(datadir.path('generic.csv'), ['--cat', '-s', 'base', '--no-cache', '--head', '2'])
+    out = do_csvless(path, ['--cat', '-s', 'base', '--no-cache', '--head', '2'])
+    assert out == expected
+
+
+def test_threaded_reader(datadir):
+    from drawtable.csvless.readers import ThreadedReader
+
+    rows = [[str(i)] for i in range(1234)]
+    reader = ThreadedReader(iter(rows), queue_size=2, batch_size=100)
+    assert next(reader) == ['0']
+    assert list(reader) == rows[1:]
+
+    def broken():
+        yield ['1']
+        raise ValueError('broken input')
+
+    with pytest.raises(ValueError):
+        list(ThreadedReader(broken()))
+
+    # the reader thread is stopped when rows are not read till the end
+    reader = ThreadedReader(iter(rows), queue_size=1, batch_size=1)
+    next(reader)
+    reader.close()
+    assert not reader.thread.is_alive()
+
+    expected = do_csvless(datadir.path('generic.csv'), ['--cat', '-s', 'base', '--no-cache'])
+    assert do_csvless(datadir.path('generic.csv'), ['--cat', '-s', 'base', '--no-cache', '--read-ahead', '4']) == expected
+
+
+def test_csvless_sort(tmpdir):
+    path = tmpdir.join('sort.csv')
+    path.write('id,day\n1,2024-03-01\n2,2023-12-31\n3,2024-01-15\n')
+    assert do_csvless(str(path), ['--cat', '-s', 'base', '--no-cache', '--sort', 'day']).splitlines() == [
+        ' id  day        ', ' 2   2023-12-31 ', ' 3   2024-01-15 ', ' 1   2024-03-01 ']
+    assert do_csvless(str(path), ['--cat', '-s', 'base', '--no-cache', '--sort', '#2:desc', '--head', '1']).splitlines() == [
+        ' id  day        ', ' 1   2024-03-01 ']
+    # the tail of the sorted rows, not the sorted tail of the file
+    assert do_csvless(str(path), ['--cat', '-s', 'base', '--no-cache', '--sort', 'day', '--tail', '2']).splitlines() == [
+        ' id  day        ', ' 3   2024-01-15 ', ' 1   2024-03-01 ']
+
+
+def test_csvless_stats(datadir):
+    out = do_csvless(datadir.path('generic.csv'), ['--cat', '-s', 'base', '--no-cache', '--stats'])
+    assert out.splitlines()[:2] == [
+        ' column        count  nulls  distinct  min           max    sum  mean ',
+        ' foo               1      1         1  1             1        1     1 ',
+    ]
+
+
+def test_csvless_stats_limited(tmpdir):
+    path = tmpdir.join('stats.csv')
+    content = 'v\n' + ''.join('{}\n'.format(i) for i in range(1, 6))
+    path.write(content)
+    args = ['--cat', '-s', 'base', '--no-cache', '--stats']
+
+    def stats_of(out):
+        # count, nulls, distinct, min, max of the column
+        return out.splitlines()[1].split()[1:6]
+
+    assert stats_of(do_csvless(str(path), args + ['--head', '2'])) == ['2', '0', '2', '1', '2']
+    assert stats_of(do_csvless(str(path), args + ['--sample', '3']))[0] == '3'
+    assert stats_of(do_csvless(str(path), args + ['--tail', '2', '--sort', 'v:desc'])) == ['2', '0', '2', '1', '2']
+    p = subprocess.Popen(['python', '-m', 'drawtable.csvless', '--tail', '2'] + args + ['/dev/stdin'],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out, _ = p.communicate(content.encode())
+    assert stats_of(out.decode()) == ['2', '0', '2', '4', '5']
+
+
+@pytest.mark.parametrize('encoding, text', [
+    ('gb18030', u'名字,城市\n张三,北京\n李四,上海\n'),
+    ('shift_jis', u'名前,都市\nたなか,東京\nやまだ,大阪\n'),
+    ('big5', u'名字,城市\n張三,臺北\n李四,高雄\n'),
+    ('cp1252', u'name,city\nJosé,Zürich – “quoted”\n'),
+    ('utf-8-sig', u'name,city\nfoo,bar\n'),
+    ('utf-16', u'name,city\nfoo,bar\n'),
+])
+def test_sniff_encoding(tmpdir, encoding, text):
+    from drawtable.csvless.encoding import sniff_encoding
+
+    assert sniff_encoding(text.encode(encoding)) == encoding
+    utf8_path = tmpdir.join('utf8.csv')
+    utf8_path.write_text(text, encoding='utf-8')
+    path = tmpdir.join('encoded.csv')
+    path.write_binary(text.encode(encoding))
+    args = ['--cat', '-s', 'base', '--no-cache']
+    assert do_csvless(str(path), args) == do_csvless(str(utf8_path), args)
+
+
+def test_wrong_encoding(tmpdir):
+    path = tmpdir.join('gbk.csv')
+    path.write_binary(u'名字,城市\n张三,北京\n'.encode('gbk'))
+    p = subprocess.Popen(['python', '-m', 'drawtable.csvless', '--cat', '-e', 'utf-8', str(path)],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    assert p.returncode == 2
+    assert b'not valid utf-8 at byte 0, it looks like gb18030' in err
+
+    p = subprocess.Popen(['python', '-m', 'drawtable.csvless', '--cat', '-e', 'foo', str(path)],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    assert p.returncode == 2
+    assert b'unknown encoding foo' in err
+    assert b'Traceback' not in err
+
+
+@pytest.mark.parametrize('sample, reader_kwargs, expected, has_header', [
+    ('name\tage\nfoo\t1\nbar\t2\n', {}, {'delimiter': '\t'}, True),
+    ("name;city\n'a;b';x\n'c';y\n", {}, {'delimiter': ';', 'quotechar': "'"}, None),
+    ('1,2\n3,4\n5,6\n', {}, {}, False),
+    ('id,2019,2020\n1,2,3\n4,5,6\n', {}, {}, True),
+    ("city,year\n's-Hertogenbosch,1990\nParis,1991\n", {}, {}, True),
+    ('a;b\n1;2\n', {'delimiter': ','}, {'delimiter': ','}, None),
+])
+def test_sniff_dialect(sample, reader_kwargs, expected, has_header):
+    from drawtable.csvless.dialect import sniff_dialect
+
+    assert sniff_dialect(sample, reader_kwargs) == (expected, has_header)
+
+
+def test_csvless_sniff(tmpdir):
+    csv_path = tmpdir.join('a.csv')
+    csv_path.write('name,age\nfoo,1\nbar,2\n')
+    tsv_path = tmpdir.join('a.tsv')
+    tsv_path.write('name\tage\nfoo\t1\nbar\t2\n')
+    args = ['--cat', '--no-cache']
+    assert do_csvless(str(tsv_path), args) == do_csvless(str(csv_path), args)
+    assert do_csvless(str(tsv_path), args + ['--no-sniff']) != do_csvless(str(csv_path), args)
@@ -86,3 +86,337 @@ Excepteur sint occaecat cupidatat non proident, sunt in culpa qui officia deseru
 """
     Table(margin_x=1, margin_y=0, max_col_width=40, table_style='box').draw([[lorem]], writer=writer.write)
     assert writer.getvalue() == want
+
+
+def test_stream_same_as_buffered():
+    data = [['foo', 'bar']] + [[random_str(random.randint(0, 20)), 'x\ny'] for i in range(20)]
+    for style in ['base', 'box', 'markdown', 'rst-grid']:
+        want, get = StringIO(), StringIO()
+        Table(max_col_width=15, table_style=style).draw(data, writer=want.write)
+        Table(max_col_width=15, table_style=style, stream=True).draw(iter(data), writer=get.write)
+        assert get.getvalue() == want.getvalue()
+
+
+def test_stream_sample_size(writer):
+    data = iter([['a', 'b'], ['1', '2'], ['12345', '2']])
+    Table(table_style='base', wrap_row=False, stream=True, sample_size=1).draw(data, writer=writer.write)
+    # width of column a is calculated from the first row only
+    assert writer.getvalue() == ' a  b \n 1  2 \n …  2 \n'
+
+
+def test_given_cols_width(writer):
+    data = iter([['a', 'b'], ['1', '2'], ['12345', '2']])
+    Table(table_style='base').draw(data, writer=writer.write, cols_width={0: 3, 1: 1})
+    assert writer.getvalue() == ' a    b \n 1    2 \n 123  2 \n 45     \n'
+
+
+def test_retention(writer):
+    data = [['a'], ['1'], ['2'], ['3']]
+    tb = Table(table_style='base')
+    tb.draw(data, writer=writer.write)
+    assert tb.row_strs is None
+    assert tb.draw_result['retained_bytes_peak'] == 0
+
+    tb = Table(table_style='base', retention='full')
+    tb.draw(data, writer=writer.write)
+    assert list(tb.row_strs) == [' a ', ' 1 ', ' 2 ', ' 3 ']
+    assert tb.draw_result['retained_bytes_peak'] == 12
+
+    tb = Table(table_style='base', retention='ring', retention_size=2)
+    tb.draw(data, writer=writer.write)
+    assert list(tb.row_strs) == [' 2 ', ' 3 ']
+    assert tb.draw_result['retained_bytes_peak'] == 6
+
+    with pytest.raises(ValueError):
+        Table(retention='all')
+    with pytest.raises(ValueError):
+        Table(retention='ring', retention_size=0)
+
+    if not PY2:
+        # lone surrogates, e.g. from `surrogateescape`
+        tb = Table(table_style='base', retention='full')
+        tb.draw([['a'], [b'\xff'.decode('utf-8', 'surrogateescape')]], writer=writer.write)
+        assert tb.draw_result['retained_bytes_peak'] == 8
+
+
+def test_width_cache():
+    from drawtable import width
+
+    width.clear_cache()
+    assert width.str_width(u'abc') == 3
+    assert width.cache_info()['misses'] == 0
+    assert width.str_width(u'中文') == 4
+    assert width.str_width(u'中文') == 4
+    info = width.cache_info()
+    assert info['misses'] == 1
+    assert info['hits'] == 1
+    assert width.text_width(u'ab\n中文字') == 6
+    assert width.text_width(u'中\t文') == 5
+
+
+def test_truncate_str():
+    from drawtable import truncate_str
+
+    assert truncate_str(u'abcdef', 6) == u'abcdef'
+    assert truncate_str(u'abcdef', 4) == u'abc…'
+    assert truncate_str(u'中文字符', 8) == u'中文字符'
+    assert truncate_str(u'中文字符', 6) == u'中文…'
+    assert truncate_str(u'中文字符', 5) == u'中文…'
+    assert truncate_str(u'a中文', 4) == u'a中…'
+    assert truncate_str(u'中文', 1) == u'…'
+    assert truncate_str(u'中文', 0) == u''
+    assert truncate_str(u'a\tb', 16) == u'a\tb'
+    assert truncate_str(u'a\tbcd', 4) == u'a\tb…'
+    assert truncate_str(u'中\t文文', 4) == u'中\t…'
+
+
+def test_no_wrap_control_chars(writer):
+    data = [['a', 'b'], [u'中\t文文', 'x'], ['ab', 'y']]
+    Table(table_style='base', wrap_row=False, max_col_width=4).draw(data, writer=writer.write)
+    assert writer.getvalue() == u' a     b \n 中\t…  x \n ab    y \n'
+
+
+def test_wrap_wide_chars(writer):
+    Table(table_style='base', max_col_width=5).draw([[u'中文字符串'], [u'ab中文字']], writer=writer.write)
+    assert writer.getvalue() == u' 中文  \n 字符  \n 串    \n ab中  \n 文字  \n'
+
+
+def test_word_wrap(writer):
+    Table(table_style='base', max_col_width=8, word_wrap=True).draw([['foo bar baz quux']], writer=writer.write)
+    assert writer.getvalue() == ' foo bar  \n baz quux \n'
+
+
+def test_draw_parallel():
+    data = [['foo', 'bar']] + [[random_str(random.randint(0, 20)), 'x\ny'] for i in range(50)]
+    for style in ['base', 'box']:
+        want, get = StringIO(), StringIO()
+        Table(max_col_width=15, table_style=style, row_numbers=True).draw(data, writer=want.write)
+        tb = Table(max_col_width=15, table_style=style, row_numbers=True)
+        tb.parallel_chunk_size = 7
+        tb.draw(data, writer=get.write, workers=2)
+        assert get.getvalue() == want.getvalue()
+        assert tb.draw_result['row_num'] == 50
+
+
+def test_column_window(writer):
+    data = [['a', 'bb', 'ccc', 'dddd'], ['1', '2', '3', '4']]
+    tb = Table(table_style='box', window_start_col=1, window_width=10)
+    tb.draw(data, writer=writer.write)
+    assert list(tb.visible_cols) == [1, 2]
+    assert writer.getvalue() == u"""\
+┌────┬─────┐
+│ bb │ ccc │
+├────┼─────┤
+│ 2  │ 3   │
+└────┴─────┘
+"""
+
+
+def test_row_template():
+    data = [['a', 'b{}', 'c']] + [[random_str(random.randint(0, 20)), u'中', '', 'x\ny'][:random.randint(1, 4)] for i in range(20)]
+    for wrap_row in (True, False):
+        want, get = StringIO(), StringIO()
+        tb = Table(max_col_width=10, table_style='box', wrap_row=wrap_row, row_numbers=True)
+        tb.use_row_template = False
+        tb.draw(data, writer=want.write)
+        tb = Table(max_col_width=10, table_style='box', wrap_row=wrap_row, row_numbers=True)
+        tb.draw(data, writer=get.write)
+        assert tb.row_template == u'│ {:<10} │ {:<3} │ {:<1} │ {:<1} │'
+        assert get.getvalue() == want.getvalue()
+
+
+def test_align(writer):
+    data = [['n', 's', 'c'], ['1', 'a', u'中'], ['1,200.5', 'bb', 'yyy'], ['', 'c', '']]
+    Table(table_style='base', align_numeric=True, cols_align={'c': 'center'}).draw(data, writer=writer.write)
+    assert writer.getvalue() == u"""\
+       n  s    c  
+       1  a   中  
+ 1,200.5  bb  yyy 
+          c       
+"""
+
+
+def test_align_same_with_template():
+    data = [['a', 'b', 'c']] + [[random_str(random.randint(0, 8)), u'中' * random.randint(0, 3), '12'] for i in range(20)]
+    for align in ['left', 'right', 'center']:
+        want, get = StringIO(), StringIO()
+        tb = Table(table_style='box', align=align)
+        tb.use_row_template = False
+        tb.draw(data, writer=want.write)
+        Table(table_style='box', align=align).draw(data, writer=get.write)
+        assert get.getvalue() == want.getvalue()
+
+
+def test_cols_config(writer):
+    data = [['id', 'name', 'notes'], ['1', 'foo', 'x'], ['2', 'a long name', 'y']]
+    Table(table_style='base', cols_config={
+        'id': {'min': 4},
+        1: {'max': 6},
+        'notes': {'hidden': True},
+    }).draw(data, writer=writer.write)
+    assert writer.getvalue() == """\
+ id    name   
+ 1     foo    
+ 2     a long 
+        name  
+"""
+
+
+def test_cols_config_fixed_skips_scan(writer):
+    def data():
+        yield ['id', 'name']
+        yield ['1', 'foo']
+        yield ['2', 'bar']
+
+    tb = Table(table_style='base', cols_config={'id': {'fixed': 3}, 'name': {'fixed': 5}})
+    tb.draw(data(), writer=writer.write)
+    # widths are not measured
+    assert tb.draw_result['data_cols_width'] is None
+    assert writer.getvalue() == ' id   name  \n 1    foo   \n 2    bar   \n'
+
+
+def test_select_data(writer):
+    data = [['id', 'name', 'score'], ['1', 'foo', '9'], ['2', 'bar', '10'], ['3', 'baz']]
+    Table(table_style='base', columns=['name', 0], where=[('score', '>=', '9'), ('name', '~', 'a')]).draw(
+        data, writer=writer.write)
+    assert writer.getvalue() == ' name  id \n bar   2  \n'
+
+
+def test_where_numbers():
+    from drawtable import compile_where
+    from drawtable.number import to_number
+
+    assert to_number(u' 1,200 ') == 1200
+    assert to_number(u'12.5%') == 12.5
+    assert to_number(u'nan') is None
+    predicate = compile_where([(0, '>', '999')], [])
+    assert [v for v in [u'1,200', u'998', u'1e3', u'abc'] if predicate([v])] == [u'1,200', u'1e3', u'abc']
+
+
+def test_limit_data():
+    def data():
+        yield ['h']
+        for i in range(100):
+            yield [str(i)]
+        raise AssertionError('read past head')
+
+    assert list(Table.limit_data(data(), head=2)) == [['h'], ['0'], ['1']]
+    rows = [['h']] + [[str(i)] for i in range(100)]
+    assert list(Table.limit_data(rows, tail=2)) == [['h'], ['98'], ['99']]
+    sampled = list(Table.limit_data(rows, sample=10))
+    assert sampled[0] == ['h'] and len(sampled) == 11
+    assert sampled[1:] == sorted(sampled[1:], key=lambda r: int(r[0]))
+    assert list(Table.limit_data(rows[:3], False, sample=10)) == rows[:3]
+
+
+def test_column_store():
+    from drawtable import update_cols_width
+    from drawtable.store import ColumnStore
+
+    rows = [[random.choice(['', 'x' * 300, u'中文', 'ab', 'x\ny']) for _ in range(random.randint(0, 5))]
+            for _ in range(200)]
+    store = ColumnStore()
+    store.batch_size = 7
+    store.extend(rows)
+    assert len(store) == len(rows)
+    assert list(store) == rows
+    assert store[10:20] == rows[10:20]
+    cols_width = {}
+    for row in rows:
+        update_cols_width(cols_width, row)
+    assert store.cols_width() == cols_width
+
+    data = [['a', 'b', 'c']] + rows
+    want, get = StringIO(), StringIO()
+    tb = Table(max_col_width=10, table_style='box', row_numbers=True)
+    tb.use_column_store = False
+    tb.draw(data, writer=want.write)
+    Table(max_col_width=10, table_style='box', row_numbers=True).draw(data, writer=get.write)
+    assert get.getvalue() == want.getvalue()
+
+
+def test_column_store_surrogates():
+    from drawtable.store import ColumnStore
+
+    # e.g. bytes decoded with `surrogateescape`
+    rows = [[u'a\udcff', u'b'], [u'\ud800']]
+    store = ColumnStore()
+    store.extend(rows)
+    assert list(store) == rows
+    out = StringIO()
+    Table().draw([[u'h'], [u'\udcff']], writer=out.write)
+    assert u'\udcff' in out.getvalue()
+
+
+def test_sort_key():
+    from drawtable.sort import sort_key
+
+    values = ['b', '', '10', '2024-01-02', '9.5', '1,000', 'a', '2023-12-31 10:00:00', '5%', 'nan']
+    assert sorted(values, key=sort_key) == [
+        '5%', '9.5', '10', '1,000', '2023-12-31 10:00:00', '2024-01-02', 'a', 'b', 'nan', '']
+
+
+def test_sort_rows(monkeypatch):
+    from drawtable import sort as sort_module
+    from drawtable.sort import RowSorter
+
+    monkeypatch.setattr(sort_module, 'MERGE_FAN_IN', 3)
+    rows = [[str(random.randint(0, 50)), str(i), u'中' * (i % 3)] for i in range(500)]
+    for desc in (False, True):
+        want = sorted(rows, key=lambda r: int(r[0]), reverse=desc)
+        in_memory = RowSorter(0, desc)
+        in_memory.extend(rows)
+        assert list(in_memory.sorted()) == want
+        # spill runs of a few rows to temp files
+        external = RowSorter(0, desc, memory=1000)
+        external.extend(rows)
+        assert len(external.runs) > 3
+        assert list(external.sorted()) == want
+        assert external.cols_width == in_memory.cols_width == {0: 2, 1: 3, 2: 4}
+
+
+def test_draw_sorted(writer):
+    data = [['name', 'score'], ['a', '10'], ['b', '9'], ['c', '']]
+    tb = Table(table_style='base', sort_by='score', sort_desc=True)
+    tb.draw(data, writer=writer.write)
+    assert writer.getvalue() == ' name  score \n c           \n a     10    \n b     9     \n'
+    assert tb.draw_result['data_cols_width'] == {0: 1, 1: 2}
+
+
+def test_stats():
+    from drawtable.stats import TableStats, HyperLogLog
+
+    hll = HyperLogLog()
+    for i in range(100000):
+        hll.add(str(i))
+    assert abs(hll.count() - 100000) < 5000
+
+    stats = TableStats()
+    rows = [['1', 'a'], ['1,000', ''], ['2.5', 'b', 'x']]
+    assert list(stats.observe(rows)) == rows
+    assert stats.summary_rows(['n', 's']) == [
+        ['column', 'count', 'nulls', 'distinct', 'min', 'max', 'sum', 'mean'],
+        ['n', '3', '0', '3', '1', '1,000', '1003.5', '334.5'],
+        ['s', '2', '1', '2', 'a', 'b', '', ''],
+        ['#3', '1', '2', '1', 'x', 'x', '', ''],
+    ]
+
+
+def test_stats_footer(writer):
+    data = [['n', 's'], ['1', 'a'], ['3', '']]
+    tb = Table(table_style='markdown', stats=True)
+    tb.draw(data, writer=writer.write)
+    assert tb.draw_result['stats'].rows == 2
+    assert writer.getvalue() == u"""\
+| n           | s           |
+|-------------|-------------|
+| 1           | a           |
+| 3           |             |
+| count: 2    | count: 1    |
+| nulls: 0    | nulls: 1    |
+| distinct: 2 | distinct: 1 |
+| min: 1      | min: a      |
+| max: 3      | max: a      |
+| sum: 4      |             |
+| mean: 2     |             |
+"""